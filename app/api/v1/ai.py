@@ -8,11 +8,12 @@ from app.models.pydantic_schemas import (
     AIHealthResponse,
     MessageModel,
 )
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db import get_db
+from app.db import get_db, AsyncSessionLocal
 from pydantic import BaseModel
 from typing import List
+import json
 
 router = APIRouter()
 
@@ -23,6 +24,41 @@ def generate_fallback_document(prompt: str) -> str:
     return f"""[Fallback Generated Document]\n\nTitle: {prompt}\n\nThis is a template-based legal document generated as a fallback. Please provide more details for a more specific draft.\n\n[Note: This is a fallback and not a legally binding document. Consult a qualified attorney for legal matters.]"""
 
 
+def chat_fallback_response(message: str) -> str:
+    """
+    Helpful reply used when the AI returns an empty chat response.
+    """
+    return f"""I understand you're asking about: "{message}"
+
+I'm here to help with legal document drafting and legal questions. Here are some things I can help you with:
+
+1. **Document Generation**: I can draft NDAs, contracts, lease agreements, and other legal documents
+2. **Legal Questions**: I can provide general information about legal concepts
+3. **Document Review**: I can help explain legal terms and clauses
+
+Could you please provide more specific details about what type of legal document or information you need?
+
+[Note: This is general information only and not legal advice. Please consult with a qualified attorney for specific legal matters.]"""
+
+
+def chat_reply_failed(reply: str) -> bool:
+    """
+    True for an empty chat reply or one reporting a drafting error, which is not saved as a normal answer.
+    """
+    return not reply.strip() or reply.lstrip().startswith("Error")
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    """
+    Format one Server-Sent Events frame.
+    """
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data, default=str)}\n\n"
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
 from app.services.drafting_service import DraftingService
 from app.services.message_service import MessageService
 
@@ -57,33 +93,14 @@ async def chat_with_ai(request: ChatRequest, db: AsyncSession = Depends(get_db))
 
             raise HTTPException(status_code=404, detail="Session not found")
 
-        # Get conversation history for context
-        messages = await message_service.list_messages(
-            db, session_id=request.session_id
-        )
-        conversation_history = [
-            {"role": msg.role, "content": msg.content}
-            for msg in messages[-10:]  # Last 10 messages
-        ]
-
-        # Generate AI response
-        ai_response = drafting_service.generate_document(
-            prompt=request.message, conversation_history=conversation_history
+        # Advance the session's drafting state; only the final turn generates
+        ai_response = await drafting_service.achat_turn(
+            session_id=str(request.session_id), message=request.message
         )
 
-        # If AI response is empty, provide a helpful fallback
-        if not ai_response or ai_response.strip() == "":
-            ai_response = f"""I understand you're asking about: "{request.message}"
-
-I'm here to help with legal document drafting and legal questions. Here are some things I can help you with:
-
-1. **Document Generation**: I can draft NDAs, contracts, lease agreements, and other legal documents
-2. **Legal Questions**: I can provide general information about legal concepts
-3. **Document Review**: I can help explain legal terms and clauses
-
-Could you please provide more specific details about what type of legal document or information you need?
-
-[Note: This is general information only and not legal advice. Please consult with a qualified attorney for specific legal matters.]"""
+        # If AI response is empty or an error, provide a helpful fallback
+        if not ai_response or chat_reply_failed(ai_response):
+            ai_response = chat_fallback_response(request.message)
 
         # Save AI response
         ai_message = await message_service.create_message(
@@ -122,6 +139,63 @@ Could you please provide more specific details about what type of legal document
         raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
 
 
+@router.post("/chat/stream/")
+async def chat_with_ai_stream(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Streaming variant of /chat/: relays AI tokens as Server-Sent Events while they are
+    generated. The assembled AI message is saved once the stream ends and sent in a
+    final "done" event.
+    """
+    user_message = await message_service.create_message(
+        db=db, session_id=request.session_id, role="user", content=request.message
+    )
+    if not user_message:
+        from fastapi import HTTPException
+
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    user_msg = MessageModel.model_validate(user_message).model_dump(mode="json")
+
+    async def event_stream():
+        yield sse_event({"user_message": user_msg}, event="start")
+        parts = []
+        try:
+            async for token in drafting_service.astream_chat_turn(
+                session_id=str(request.session_id), message=request.message
+            ):
+                parts.append(token)
+                yield sse_event({"token": token})
+        except Exception as e:
+            yield sse_event({"detail": f"Error processing chat: {str(e)}"}, event="error")
+
+        ai_response = "".join(parts)
+        # Same rule as /chat/: empty or error replies are replaced by the fallback
+        if chat_reply_failed(ai_response):
+            if ai_response.strip():
+                yield sse_event(
+                    {"detail": "AI reply contained an error; replacing it with the fallback reply"},
+                    event="error",
+                )
+            # Marked so clients can replace what was streamed and tell it from a real reply
+            ai_response = chat_fallback_response(request.message)
+            yield sse_event({"token": ai_response, "fallback": True})
+
+        # The request-scoped session is closed once streaming starts; persist with a fresh one
+        async with AsyncSessionLocal() as stream_db:
+            ai_message = await message_service.create_message(
+                db=stream_db,
+                session_id=request.session_id,
+                role="assistant",
+                content=ai_response,
+            )
+            ai_msg = MessageModel.model_validate(ai_message).model_dump(mode="json")
+        yield sse_event({"ai_message": ai_msg}, event="done")
+
+    return StreamingResponse(
+        event_stream(), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
 @router.post("/generate/", response_model=GenerateResponse)
 def generate_document(request: GenerateRequest):
     """
@@ -145,6 +219,44 @@ def generate_document(request: GenerateRequest):
         )
 
 
+@router.post("/generate/stream/")
+async def generate_document_stream(request: GenerateRequest):
+    """
+    Streaming variant of /generate/: relays document tokens as Server-Sent Events.
+    """
+
+    async def event_stream():
+        parts = []
+        try:
+            async for token in drafting_service.astream_document(
+                prompt=request.prompt,
+                conversation_history=request.conversation_history,
+            ):
+                parts.append(token)
+                yield sse_event({"token": token})
+        except Exception as e:
+            yield sse_event({"detail": f"Generation interrupted: {str(e)}"}, event="error")
+        result = "".join(parts)
+        # Same rule as /generate/: empty or error output is replaced by the fallback
+        if not result.strip() or "Error:" in result:
+            if result.strip():
+                yield sse_event(
+                    {"detail": "AI output contained an error; replacing it with the fallback template"},
+                    event="error",
+                )
+            # Fallback to template-based generation, marked so clients can tell it from a real draft
+            result = (
+                f"{generate_fallback_document(request.prompt)}\n\n"
+                "[Note: Generated using fallback template due to AI service unavailability]"
+            )
+            yield sse_event({"token": result, "fallback": True})
+        yield sse_event({"result": result}, event="done")
+
+    return StreamingResponse(
+        event_stream(), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
 @router.post("/refine/", response_model=GenerateResponse)
 def refine_document(request: RefineRequest):
     """
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, status, UploadFile, File, Response
 from app.models.pydantic_schemas import (
     DocumentModel,
+    DocumentUploadResponse,
+    IngestionJobModel,
     CreateDocumentRequest,
     GenerateFormattedDocumentResponse,
     DocumentDetailsRequest,
@@ -37,35 +39,77 @@ class DocumentDetailsResponse(BaseModel):
     details: Dict[str, Any]
 
 
+import os
+import uuid
+import tempfile
 from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from app.services.document_service import DocumentService
+from app.services.ingestion_service import IngestionService
 from app.db import get_db
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
 
 router = APIRouter()
 document_service = DocumentService()
+ingestion_service = IngestionService()
+
+UPLOAD_DIR = "uploaded_docs"
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 
 @router.post(
-    "/upload/", response_model=DocumentModel, status_code=status.HTTP_201_CREATED
+    "/upload/",
+    response_model=DocumentUploadResponse,
+    status_code=status.HTTP_202_ACCEPTED,
 )
 async def upload_document(
     session_id: int, file: UploadFile = File(...), db: AsyncSession = Depends(get_db)
 ):
-    file_bytes = await file.read()
-    # Store file to disk or storage (production: use a secure path)
-    file_path = f"uploaded_docs/{file.filename}"
-    with open(file_path, "wb") as f:
-        f.write(file_bytes)
+    filename = os.path.basename(file.filename)
+    # Every upload gets its own path, so a same-named upload (from any session)
+    # cannot replace the file before its background indexing job reads it
+    session_dir = os.path.join(UPLOAD_DIR, str(session_id))
+    file_path = os.path.join(session_dir, f"{uuid.uuid4().hex}_{filename}")
+    os.makedirs(session_dir, exist_ok=True)
+
+    # Stream to a temp file in chunks, then move it into place atomically
+    fd, tmp_path = tempfile.mkstemp(dir=session_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await run_in_threadpool(f.write, chunk)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
     doc = await document_service.create_document(
         db,
         session_id=session_id,
-        title=file.filename,
-        filename=file.filename,
+        title=filename,
+        filename=filename,
+        file_path=file_path,
+        status="pending",
+    )
+    # Indexing runs in the background; poll /documents/jobs/{job_id}/ for progress
+    job = ingestion_service.submit(
+        document_id=doc.id,
+        session_id=session_id,
         file_path=file_path,
+        filename=filename,
+    )
+    return DocumentUploadResponse(
+        **DocumentModel.model_validate(doc).model_dump(), job_id=job["id"]
     )
-    return doc
+
+
+@router.get("/jobs/{job_id}/", response_model=IngestionJobModel)
+async def get_ingestion_job(job_id: str):
+    job = ingestion_service.get_job(job_id)
+    if not job:
+        return JSONResponse(content={"detail": "Job not found"}, status_code=404)
+    return IngestionJobModel(**job)
 
 
 @router.get("/", response_model=list[DocumentModel])
@@ -39,6 +39,7 @@ async def root():
 
 # Eagerly load models and embeddings at startup
 from document_qa.graphRag import DocumentQARAG
+from app.api.v1.documents import ingestion_service
 
 
 @app.on_event("startup")
@@ -46,9 +47,16 @@ def load_all_models():
     # Instantiate DocumentQARAG to load all models/embeddings
     global rag_agent
     rag_agent = DocumentQARAG()
+    # Background document ingestion shares the preloaded agent
+    ingestion_service.rag_agent = rag_agent
     print("API ready")
 
 
+@app.on_event("shutdown")
+def stop_background_workers():
+    ingestion_service.shutdown()
+
+
 # Error handling middleware
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
@@ -124,6 +124,20 @@ class DocumentModel(BaseModel):
     updated_at: datetime
 
 
+class DocumentUploadResponse(DocumentModel):
+    job_id: str
+
+
+class IngestionJobModel(BaseModel):
+    id: str
+    document_id: int
+    status: str
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
 class CreateDocumentRequest(BaseModel):
     session_id: int
     title: str
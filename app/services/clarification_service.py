@@ -36,10 +36,20 @@ class ClarificationService:
     ) -> dict:
         return self.summarizer.summarize_search_results(search_results, summary_type)
 
+    def cache_stats(self) -> dict:
+        """Hit/miss statistics of the search, summary and LLM completion caches."""
+        gateway = self.search_graph.gateway
+        return {
+            "search": self.search_graph.search_cache.stats(),
+            "summary": self.summarizer.summary_cache.stats(),
+            "llm_completions": gateway.completion_cache.stats(),
+        }
+
     def health_check(self) -> dict:
         return {
             "status": "healthy",
             "ai_configured": bool(self.search_graph and self.summarizer),
             "modules_loaded": True,
             "debug_mode": False,
+            "cache": self.cache_stats(),
         }
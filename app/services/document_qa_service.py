@@ -15,7 +15,7 @@ class DocumentQAService:
         Use the RAG agent to answer a query over uploaded documents (LLM-powered).
         """
         try:
-            return self.rag_agent.query_documents(query, session_id=session_id)
+            return self.rag_agent.query_existing_documents(query, session_id=session_id)
         except Exception as e:
             import logging
             logging.error(f"DocumentQAService.answer_query error: {e}")
@@ -1,5 +1,6 @@
 import os
-from typing import List, Dict, Any
+from datetime import datetime
+from typing import List, Dict, Any, AsyncIterator, Iterator
 from drafting.graph import LegalDocumentAgent, AgentState
 from drafting.memory import SessionMemoryManager
 
@@ -15,32 +16,26 @@ class DraftingMessageService:
 
     def list_messages(self, session_id: str = None):
         # Return all messages for a given session_id, or all if not specified
-        if session_id:
-            session = self.manager.get_session(session_id)
-            return session.get("conversation_history", []) if session else []
-        # If no session_id, aggregate all messages from all sessions
-        all_msgs = []
-        for sid in self.manager.list_sessions():
-            session = self.manager.get_session(sid)
-            all_msgs.extend(session.get("conversation_history", []))
-        return all_msgs
+        return self.manager.list_messages(session_id)
 
     def create_message(
         self, session_id: str, role: str, content: str, metadata: dict = None
     ):
-        session = self.manager.get_session(session_id)
-        if not session:
-            return None
-        msg = {
-            "id": f"msg_{len(session.get('conversation_history', []))+1}",
-            "session": session_id,
-            "role": role,
-            "content": content,
-            "metadata": metadata or {},
-            "created_at": session.get("last_updated"),
-        }
-        session.setdefault("conversation_history", []).append(msg)
-        self.manager.save_session(session_id, session)
+        # Held across the read and the append so parallel requests get distinct ids
+        with self.manager.session_lock(session_id):
+            session = self.manager.get_session(session_id)
+            if not session:
+                return None
+            msg = {
+                "id": f"msg_{len(session.get('conversation_history', []))+1}",
+                "session": session_id,
+                "role": role,
+                "content": content,
+                "metadata": metadata or {},
+                "created_at": datetime.now().isoformat(),
+            }
+            # Append-only write; the rest of the session is not rewritten
+            self.manager.append_message(session_id, msg)
         return msg
 
 
@@ -81,9 +76,9 @@ class DraftingService:
     def __init__(self):
         self.agent = LegalDocumentAgent()
 
-    def generate_document(
+    def _prepare_state(
         self, prompt: str, conversation_history: List[Dict[str, str]]
-    ) -> str:
+    ) -> Dict[str, Any]:
         # Compose initial state from prompt and conversation history
         state = AgentState(
             session_id="api-session",
@@ -103,10 +98,69 @@ class DraftingService:
         state_dict = self.agent.ask_question(state_dict)
         # For API, assume all info is in conversation_history; skip Q&A loop
         state_dict["is_complete"] = True
+        return state_dict
+
+    def generate_document(
+        self, prompt: str, conversation_history: List[Dict[str, str]]
+    ) -> str:
+        state_dict = self._prepare_state(prompt, conversation_history)
         # Generate document
         state_dict = self.agent.generate_document(state_dict)
         return state_dict.get("final_document", "[No document generated]")
 
+    async def agenerate_document(
+        self, prompt: str, conversation_history: List[Dict[str, str]]
+    ) -> str:
+        """
+        Async generate_document for async endpoints; does not block the event loop.
+        """
+        state_dict = self._prepare_state(prompt, conversation_history)
+        state_dict = await self.agent.agenerate_document(state_dict)
+        return state_dict.get("final_document", "[No document generated]")
+
+    def stream_document(
+        self, prompt: str, conversation_history: List[Dict[str, str]]
+    ) -> Iterator[str]:
+        """
+        Same as generate_document, but yields the document tokens as the LLM produces them.
+        """
+        state_dict = self._prepare_state(prompt, conversation_history)
+        yield from self.agent.stream_document(state_dict)
+
+    async def astream_document(
+        self, prompt: str, conversation_history: List[Dict[str, str]]
+    ) -> AsyncIterator[str]:
+        """
+        Async counterpart of stream_document.
+        """
+        state_dict = self._prepare_state(prompt, conversation_history)
+        async for token in self.agent.astream_document(state_dict):
+            yield token
+
+    def chat_turn(self, session_id: str, message: str) -> str:
+        """
+        Advance the drafting conversation of a chat session by one message. Turns that
+        only collect answers return the next question without an LLM call; the turn
+        that completes the answers returns the generated document.
+        """
+        state = self.agent.run_turn(session_id, message)
+        return self.agent.turn_reply(state)
+
+    async def achat_turn(self, session_id: str, message: str) -> str:
+        """
+        Async counterpart of chat_turn.
+        """
+        state = await self.agent.arun_turn(session_id, message)
+        return self.agent.turn_reply(state)
+
+    async def astream_chat_turn(self, session_id: str, message: str) -> AsyncIterator[str]:
+        """
+        Streaming chat_turn: a question arrives as a single chunk, a generated
+        document token by token.
+        """
+        async for token in self.agent.astream_turn(session_id, message):
+            yield token
+
     def refine_document(self, current_draft: str, user_request: str) -> str:
         """
         Use LLM-powered agent to refine a legal document draft.
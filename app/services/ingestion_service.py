@@ -0,0 +1,104 @@
+import os
+import uuid
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from app.db import AsyncSessionLocal
+from app.services.document_service import DocumentService
+
+
+class IngestionService:
+    """
+    In-process background ingestion (load -> split -> embed -> persist) of uploaded
+    documents, run on a local worker pool without an external broker.
+    """
+
+    def __init__(self, max_workers: int = None, max_finished_jobs: int = 1000):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or min(4, os.cpu_count() or 1),
+            thread_name_prefix="ingestion",
+        )
+        self.document_service = DocumentService()
+        self.max_finished_jobs = max_finished_jobs
+        # Shared RAG agent; set at startup or created on first job
+        self.rag_agent = None
+        self._agent_lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._tasks = set()
+
+    def _get_rag_agent(self):
+        with self._agent_lock:
+            if self.rag_agent is None:
+                from document_qa.graphRag import DocumentQARAG
+
+                self.rag_agent = DocumentQARAG()
+            return self.rag_agent
+
+    def submit(self, document_id: int, session_id: int, file_path: str, filename: str) -> dict:
+        """
+        Enqueue an ingestion job and return immediately with its record.
+        """
+        job = {
+            "id": uuid.uuid4().hex,
+            "document_id": document_id,
+            "session_id": session_id,
+            "file_path": file_path,
+            "filename": filename,
+            "status": "pending",
+            "error": None,
+            "result": None,
+            "created_at": datetime.utcnow(),
+            "finished_at": None,
+        }
+        self._jobs[job["id"]] = job
+        task = asyncio.get_running_loop().create_task(self._run(job))
+        # Keep a reference so the task is not garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get_job(self, job_id: str) -> dict:
+        return self._jobs.get(job_id)
+
+    def _ingest(self, job: dict) -> dict:
+        file_type = os.path.splitext(job["filename"])[1].lstrip(".").lower()
+        return self._get_rag_agent().index_document(
+            job["file_path"],
+            file_type,
+            session_id=str(job["session_id"]),
+            doc_key=job["filename"],
+        )
+
+    async def _run(self, job: dict):
+        loop = asyncio.get_running_loop()
+        job["status"] = "running"
+        try:
+            job["result"] = await loop.run_in_executor(self.executor, self._ingest, job)
+            job["status"] = "indexed"
+        except Exception as e:
+            logging.error(f"IngestionService job {job['id']} failed: {e}")
+            job["error"] = str(e)
+            job["status"] = "failed"
+        job["finished_at"] = datetime.utcnow()
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await self.document_service.update_document(
+                    db, job["document_id"], {"status": job["status"]}
+                )
+        except Exception as e:
+            logging.error(f"IngestionService could not update document {job['document_id']}: {e}")
+        self._prune_jobs()
+
+    def _prune_jobs(self):
+        finished = [
+            job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None
+        ]
+        for job_id in finished[: max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,100 @@
+"""
+Micro-benchmark of search content cleaning
+Compares the original four-pass re.sub cleaner with clarification.text_cleaning
+on a corpus of DuckDuckGo-style legal search snippets, and checks that both
+produce identical output.
+
+Usage: python -m clarification.bench_clean_text [--repeat N] [--copies N]
+"""
+
+import re
+import argparse
+import timeit
+
+from .text_cleaning import clean_text, clean_texts
+
+# Snippets as returned by DuckDuckGoSearchRun for site:canlii.org / site:justice.gc.ca queries
+SNIPPETS = [
+    "A void contract is one that is not enforceable by law from the moment it was created. "
+    "In Canada, contracts for an illegal purpose, or that lack consideration or capacity, "
+    "are void ab initio; neither party can sue to enforce them.",
+    "Voidable contracts are valid and binding until the innocent party elects to rescind. "
+    "Grounds include misrepresentation, duress, undue influence and unconscionability — see "
+    "Norberg v. Wynrib, [1992] 2 S.C.R. 226.",
+    "Frustration of Contracts Act, RSBC 1996, c 166 — 1 This Act applies to any contract "
+    "governed by the law of British Columbia... https://www.canlii.org/en/bc/laws/stat/rsbc-1996-c-166/latest/",
+    "Bhasin v. Hrynew, 2014 SCC 71 (CanLII), [2014] 3 SCR 494 <https://canlii.ca/t/gf1fk> "
+    "The Court recognized a general organizing principle of good faith in contractual performance.",
+    "Consumer Protection Act, 2002, S.O. 2002, c. 30, Sched. A § 93(1): A consumer agreement is not "
+    "binding on the consumer unless the agreement is made in accordance with this Act…",
+    "<b>Limitations Act</b>, 2002 — basic limitation period: 15 (1) Unless this Act provides otherwise, "
+    "a proceeding shall not be commenced in respect of a claim after the second anniversary of the day "
+    "on which the claim was discovered.",
+    "Employment Standards Act, 2000 | ontario.ca   \n\n  Part XV — Termination and Severance of Employment: "
+    "an employer shall not terminate the employment of an employee who has been continuously employed "
+    "for three months or more unless the employer has given written notice.",
+    "Criminal Code (R.S.C., 1985, c. C-46) — Justice Laws Website https://laws-lois.justice.gc.ca/eng/acts/c-46/ "
+    "Section 366: Every one commits forgery who makes a false document, knowing it to be false…",
+    "Residential Tenancies Act, 2006, S.O. 2006, c. 17 — “landlord” includes the owner or other person "
+    "permitted to rent a rental unit; a tenancy agreement may be oral, written or implied.",
+    "Tercon Contractors Ltd. v. British Columbia (Transportation and Highways), 2010 SCC 4: the three-step "
+    "test for enforcing exclusion clauses (interpretation; unconscionability at formation; overriding "
+    "public policy).",
+    "Non-disclosure agreements (NDAs) in Canada &mdash; confidentiality obligations survive termination "
+    "where the agreement so provides; injunctive relief is available for breach (RBC Dominion Securities "
+    "Inc. v. Merrill Lynch Canada Inc., 2008 SCC 54).",
+    "Québec Civil Code, CQLR c CCQ-1991, art. 1416: Any contract which does not meet the necessary "
+    "conditions of its formation may be annulled. Art. 1417 — nullity is absolute where the condition "
+    "is necessary for the protection of the general interest.",
+]
+
+# Inputs where pass order and whitespace handling matter; checked, not timed
+EDGE_CASES = [
+    "ht<b>tp://hidden.example  text",
+    "  <p>\n  multi-line\n  tag</p>\t\u00a0tail ",
+    "see<br>https://canlii.ca/t/x<i>more</i> end",
+    "\x1c\u3000\u2028 unicode   whitespace \x85",
+    "a < b and c > d",
+    "",
+]
+
+
+def legacy_clean_text(text: str) -> str:
+    """The original LegalSummarizer._clean_text"""
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'<[^>]+>', '', text)
+    text = re.sub(r'http[s]?://\S+', '', text)
+    text = re.sub(r'[^\w\s\.,;:()"\'-]', '', text)
+    return text.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions (best is reported)")
+    parser.add_argument("--copies", type=int, default=500, help="copies of the snippet corpus per run")
+    args = parser.parse_args()
+
+    for text in EDGE_CASES:
+        assert clean_text(text) == legacy_clean_text(text), f"clean_text differs on {text!r}"
+
+    corpus = SNIPPETS * args.copies
+    expected = [legacy_clean_text(text) for text in corpus]
+    assert [clean_text(text) for text in corpus] == expected, "clean_text output differs"
+    assert clean_texts(corpus) == expected, "clean_texts output differs"
+
+    runs = {
+        "legacy re.sub": lambda: [legacy_clean_text(text) for text in corpus],
+        "clean_text": lambda: [clean_text(text) for text in corpus],
+        "clean_texts (batch)": lambda: clean_texts(corpus),
+    }
+    print(f"{len(corpus)} snippets, {sum(map(len, corpus)):,} chars, best of {args.repeat}")
+    baseline = None
+    for name, run in runs.items():
+        best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        per_snippet = best / len(corpus) * 1e6
+        print(f"{name:<22} {best * 1000:8.2f} ms  {per_snippet:6.2f} us/snippet  {baseline / best:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,19 +4,24 @@ Handles query processing, keyword extraction, and web searching with fallback LL
 """
 
 import os
-from typing import Dict, List, Optional, TypedDict
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, TypedDict
 from langgraph.graph import StateGraph, END
 from langchain_community.tools import DuckDuckGoSearchRun
 from langchain_community.llms import HuggingFacePipeline
-from openai import OpenAI
 
 from langchain.prompts import PromptTemplate
-from langchain.schema import HumanMessage
 import logging
 from datetime import datetime
 import json
 from dotenv import load_dotenv
 
+from llm_gateway.cache import CachePolicy
+from llm_gateway.gateway import get_gateway
+
+from .cache import TTLCache
+
 # Load environment variables from .env
 load_dotenv()
 
@@ -35,49 +40,73 @@ class SearchState(TypedDict):
     error_count: int
     final_summary: str
     sources: List[str]
+    # Search backend calls made so far for this question, across retries
+    searches_run: int
+    # Queries already sent for this question; retries only send new ones
+    queries_run: List[str]
+    needs_retry: bool
 
 
 class LegalSearchGraph:
     """LangGraph-based legal search and clarification system"""
 
-    def __init__(self, groq_api_key: str = None, gemini_api_key: str = None):
+    # Model used on each provider for keyword extraction
+    models = {"groq": "llama3-70b-8192", "gemini": "gemini-2.5-flash"}
+    # Keyword extraction is near-deterministic (temperature 0.1), so replies are reused for a week
+    keyword_cache = CachePolicy(ttl_seconds=7 * 24 * 3600)
+
+    # Trusted legal sources targeted by the site-specific query variants
+    legal_sites = ["canlii.org", "justice.gc.ca"]
+    # Fewer results than this trigger a retry and are not cached
+    min_results = 2
+
+    def __init__(
+        self,
+        groq_api_key: str = None,
+        gemini_api_key: str = None,
+        search_backend: Optional[Callable[[str], str]] = None,
+        fan_out: bool = True,
+        max_search_workers: int = 4,
+        max_results: int = 10,
+        search_cache: Optional[TTLCache] = None,
+        max_searches_per_query: int = 12,
+    ):
         self.groq_api_key = groq_api_key or os.getenv("GROQ_API_KEY")
         self.gemini_api_key = gemini_api_key or os.getenv("GEMINI_API_KEY")
 
-        # Initialize search tool
-        self.search_tool = DuckDuckGoSearchRun(max_results=5)
+        # Initialize search tool; any callable returning DuckDuckGo-style text
+        # (entries separated by blank lines) can stand in, e.g. a local stub
+        if search_backend is None:
+            self.search_tool = DuckDuckGoSearchRun(max_results=5)
+            search_backend = self.search_tool.run
+        self.search_backend = search_backend
+
+        # Fan-out mode runs several query variants concurrently and merges them
+        self.fan_out = fan_out
+        self.max_results = max_results
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=max_search_workers, thread_name_prefix="legal-search"
+        )
+        # Budget of backend searches per question, retries included, so one
+        # failing question cannot multiply into a burst of rate-limited calls
+        self.max_searches_per_query = max_searches_per_query
+
+        # Search results by normalized question and by normalized keyword set
+        self.search_cache = search_cache or TTLCache(ttl_seconds=6 * 3600, max_entries=2048)
 
         # Initialize LLMs with fallback mechanism
+        self.gateway = get_gateway()
         self.llms = self._initialize_llms()
 
         # Create the graph
         self.graph = self._create_graph()
 
-    def _initialize_llms(self) -> Dict:
-        """Initialize available LLMs with fallback mechanism"""
-        llms = {}
-        # Try Groq first
-        if self.groq_api_key:
-            try:
-                llms["groq"] = ChatGroq(
-                    groq_api_key=self.groq_api_key,
-                    model_name="llama3-70b-8192",
-                    temperature=0.1,
-                )
-                logger.info("Groq LLM initialized successfully")
-            except Exception as e:
-                logger.warning(f"Failed to initialize Groq: {e}")
-        # Try Gemini as fallback
-        if self.gemini_api_key:
-            try:
-                llms["gemini"] = ChatGoogleGenerativeAI(
-                    google_api_key=self.gemini_api_key,
-                    model="gemini-2.5-flash",
-                    temperature=0.1,
-                )
-                logger.info("Gemini LLM initialized successfully")
-            except Exception as e:
-                logger.warning(f"Failed to initialize Gemini: {e}")
+    def _initialize_llms(self) -> List[str]:
+        """Providers used for keyword extraction, in fallback order"""
+        # Clients, rate limits and failover are owned by the shared LLM gateway
+        llms = self.gateway.available_providers(["groq", "gemini"])
+        for llm_name in llms:
+            logger.info(f"{llm_name} LLM available through the gateway")
         # If no LLMs available, raise error (do not use transformers)
         if not llms:
             logger.error(
@@ -113,7 +142,7 @@ class LegalSearchGraph:
 
         return workflow.compile()
 
-    def _extract_keywords(self, state: SearchState) -> SearchState:
+    def _extract_keywords(self, state: SearchState, providers: Optional[List[str]] = None) -> SearchState:
         """Extract search keywords from the legal query"""
         query = state["original_query"]
 
@@ -133,28 +162,27 @@ class LegalSearchGraph:
             input_variables=["query"],
         )
 
-        # Try available LLMs in order
-        for llm_name, llm in self.llms.items():
-            try:
-                prompt_text = keyword_prompt.format(query=query)
-                response = llm.invoke([HumanMessage(content=prompt_text)])
-
-                if hasattr(response, "content"):
-                    keywords_text = response.content
-                else:
-                    keywords_text = str(response)
-
-                keywords = [k.strip() for k in keywords_text.split(",")]
-                keywords = [k for k in keywords if k]  # Remove empty strings
-
-                state["keywords"] = keywords[:5]  # Limit to 5 keywords
-                state["current_llm"] = llm_name
-                logger.info(f"Keywords extracted using {llm_name}: {keywords}")
-                break
-
-            except Exception as e:
-                logger.warning(f"Keyword extraction failed with {llm_name}: {e}")
-                continue
+        # The gateway tries the available LLMs in order
+        try:
+            completion = self.gateway.complete(
+                keyword_prompt.format(query=query),
+                providers=providers or self.llms,
+                models=self.models,
+                temperature=0.1,
+                max_tokens=100,
+                cache=self.keyword_cache,
+            )
+            keywords = [k.strip() for k in completion.content.split(",")]
+            keywords = [k for k in keywords if k]  # Remove empty strings
+
+            state["keywords"] = keywords[:5]  # Limit to 5 keywords
+            state["current_llm"] = completion.provider
+            logger.info(
+                f"Keywords extracted using {completion.provider}"
+                f"{' (cached)' if completion.cached else ''}: {keywords}"
+            )
+        except Exception as e:
+            logger.warning(f"Keyword extraction failed with all LLMs: {e}")
 
         if not state.get("keywords"):
             # Fallback to basic keyword extraction
@@ -191,35 +219,146 @@ class LegalSearchGraph:
 
         return found_terms[:5] if found_terms else ["legal", "law", "Canada"]
 
+    def _run_search(self, search_query: str) -> List[Dict]:
+        """Run one search query and parse the backend output into results"""
+        search_results = self.search_backend(search_query)
+
+        # Parse and structure results
+        results_list = []
+        if isinstance(search_results, str):
+            # Simple parsing for DuckDuckGo results
+            entries = search_results.split("\n\n")
+            for entry in entries[:5]:  # Limit to top 5 results
+                if entry.strip():
+                    results_list.append(
+                        {
+                            "content": entry.strip(),
+                            "source": "DuckDuckGo Search",
+                            "query": search_query,
+                            "timestamp": datetime.now().isoformat(),
+                        }
+                    )
+        return results_list
+
+    def _query_variants(self, keywords: List[str]) -> List[str]:
+        """Keyword-based query variants for fan-out search"""
+        sites = " OR ".join(f"site:{site}" for site in self.legal_sites)
+        joined = " ".join(keywords)
+        variants = [f"{joined} {sites}"]
+        variants += [f"{joined} site:{site}" for site in self.legal_sites]
+        variants += [f"{keyword} {sites}" for keyword in keywords]
+        return list(dict.fromkeys(variants))
+
+    @staticmethod
+    def _broad_variants(keywords: List[str]) -> List[str]:
+        """Variants without the legal-site restriction, for retries after too few results"""
+        return list(dict.fromkeys([" ".join(keywords)] + list(keywords)))
+
+    def _pending_queries(self, state: SearchState) -> List[str]:
+        """Queries of this round that have not been sent yet for the question"""
+        keywords = state.get("keywords", [])
+        variants = self._query_variants(keywords)
+        if self.fan_out:
+            # Combined keyword query and the full question first, then the narrower variants
+            candidates = variants[:1] + [state["original_query"]] + variants[1:]
+        else:
+            candidates = variants[:1]
+        if state.get("searches_run", 0):
+            # A retry: widen the search beyond the legal sites
+            candidates += self._broad_variants(keywords)
+        queries_run = set(state.get("queries_run", []))
+        pending = [q for q in dict.fromkeys(candidates) if q.strip() and q not in queries_run]
+        return pending if self.fan_out else pending[:1]
+
+    @staticmethod
+    def _merge_results(rankings: List[List[Dict]], limit: int) -> List[Dict]:
+        """Round-robin merge of per-query results, dropping duplicate entries"""
+        merged = []
+        seen = set()
+        for rank in range(max((len(r) for r in rankings), default=0)):
+            for results in rankings:
+                if rank >= len(results):
+                    continue
+                key = re.sub(r"\s+", " ", results[rank]["content"]).strip().lower()
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged.append(results[rank])
+        return merged[:limit]
+
+    def _search_budget(self, state: SearchState) -> int:
+        return max(0, self.max_searches_per_query - state.get("searches_run", 0))
+
+    def _fan_out_search(self, state: SearchState, variants: List[str]) -> List[Dict]:
+        """Run query variants concurrently and merge their results"""
+        futures = [self.search_executor.submit(self._run_search, v) for v in variants]
+
+        rankings = []
+        failures = 0
+        for variant, future in zip(variants, futures):
+            try:
+                rankings.append(future.result())
+            except Exception as e:
+                failures += 1
+                logger.warning(f"Search variant failed ({variant}): {e}")
+        if failures == len(futures):
+            raise RuntimeError("All search variants failed")
+        logger.info(f"Fan-out search ran {len(futures)} queries ({failures} failed)")
+        return self._merge_results(rankings, self.max_results)
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", text).strip().strip("?.!").strip().lower()
+
+    def _query_cache_key(self, query: str) -> tuple:
+        return ("query", self.fan_out, self._normalize(query))
+
+    def _keyword_cache_key(self, keywords: List[str]) -> tuple:
+        """Order- and case-insensitive key of a keyword set"""
+        normalized = {self._normalize(k) for k in keywords}
+        return ("keywords", self.fan_out, tuple(sorted(k for k in normalized if k)))
+
     def _search_web(self, state: SearchState) -> SearchState:
         """Perform web search using extracted keywords"""
         keywords = state.get("keywords", [])
-        search_query = " ".join(keywords) + " site:canlii.org OR site:justice.gc.ca"
 
-        try:
-            search_results = self.search_tool.run(search_query)
-
-            # Parse and structure results
-            results_list = []
-            if isinstance(search_results, str):
-                # Simple parsing for DuckDuckGo results
-                entries = search_results.split("\n\n")
-                for entry in entries[:5]:  # Limit to top 5 results
-                    if entry.strip():
-                        results_list.append(
-                            {
-                                "content": entry.strip(),
-                                "source": "DuckDuckGo Search",
-                                "timestamp": datetime.now().isoformat(),
-                            }
-                        )
+        cache_key = self._keyword_cache_key(keywords)
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            state["search_results"] = list(cached)
+            logger.info(f"Using {len(cached)} cached search results for keywords {keywords}")
+            return state
+
+        budget = self._search_budget(state)
+        if not budget:
+            logger.warning(f"Search budget of {self.max_searches_per_query} used up for this question")
+            return state
+
+        variants = self._pending_queries(state)[:budget]
+        if not variants:
+            logger.info("No new query variants left for this question")
+            return state
+        state["searches_run"] = state.get("searches_run", 0) + len(variants)
+        state["queries_run"] = state.get("queries_run", []) + variants
+        previous = state.get("search_results", [])
 
+        try:
+            if self.fan_out:
+                results_list = self._fan_out_search(state, variants)
+            else:
+                results_list = self._run_search(variants[0])
+
+            if previous:
+                # A retry adds to what the earlier rounds found
+                results_list = self._merge_results([previous, results_list], self.max_results)
             state["search_results"] = results_list
             logger.info(f"Found {len(results_list)} search results")
+            if len(results_list) >= self.min_results:
+                self.search_cache.set(cache_key, results_list)
 
         except Exception as e:
             logger.error(f"Search failed: {e}")
-            state["search_results"] = []
+            state["search_results"] = previous
             state["error_count"] = state.get("error_count", 0) + 1
 
         return state
@@ -228,9 +367,14 @@ class LegalSearchGraph:
         """Validate search results and determine if retry is needed"""
         results = state.get("search_results", [])
 
-        if len(results) < 2 and state.get("error_count", 0) < 2:
+        if (
+            len(results) < self.min_results
+            and state.get("error_count", 0) < 2
+            and self._search_budget(state)
+            and self._pending_queries(state)
+        ):
             state["needs_retry"] = True
-            logger.info("Insufficient results, will retry with different LLM")
+            logger.info("Insufficient results, will retry with new query variants")
         else:
             state["needs_retry"] = False
             logger.info(f"Validation passed with {len(results)} results")
@@ -242,9 +386,9 @@ class LegalSearchGraph:
         return "retry" if state.get("needs_retry", False) else "end"
 
     def _fallback_llm(self, state: SearchState) -> SearchState:
-        """Switch to next available LLM for retry"""
+        """Switch to next available LLM and re-extract keywords with it for the retry"""
         current_llm = state.get("current_llm", "")
-        available_llms = list(self.llms.keys())
+        available_llms = list(self.llms)
 
         try:
             current_index = available_llms.index(current_llm)
@@ -254,10 +398,29 @@ class LegalSearchGraph:
         except (ValueError, IndexError):
             state["current_llm"] = available_llms[0] if available_llms else "none"
 
+        if state["current_llm"] != current_llm and state["current_llm"] in available_llms:
+            keywords = state.get("keywords", [])
+            state["keywords"] = []
+            self._extract_keywords(state, providers=[state["current_llm"]])
+            # Different keywords give new variants; otherwise the retry only broadens
+            if not state.get("keywords"):
+                state["keywords"] = keywords
+
         return state
 
     def search_legal_query(self, query: str) -> Dict:
         """Main method to process a legal query"""
+        query_key = self._query_cache_key(query)
+        cached = self.search_cache.get(query_key)
+        if cached is not None:
+            logger.info("Serving search results from cache")
+            return {
+                **cached,
+                "query": query,
+                "cached": True,
+                "timestamp": datetime.now().isoformat(),
+            }
+
         initial_state = SearchState(
             original_query=query,
             keywords=[],
@@ -266,12 +429,15 @@ class LegalSearchGraph:
             error_count=0,
             final_summary="",
             sources=[],
+            searches_run=0,
+            queries_run=[],
+            needs_retry=False,
         )
 
         try:
             result = self.graph.invoke(initial_state)
 
-            return {
+            search_data = {
                 "success": True,
                 "query": query,
                 "keywords": result.get("keywords", []),
@@ -279,6 +445,9 @@ class LegalSearchGraph:
                 "llm_used": result.get("current_llm", "unknown"),
                 "timestamp": datetime.now().isoformat(),
             }
+            if len(search_data["results"]) >= self.min_results:
+                self.search_cache.set(query_key, search_data)
+            return search_data
 
         except Exception as e:
             logger.error(f"Search workflow failed: {e}")
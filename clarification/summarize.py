@@ -5,16 +5,23 @@ Processes search results and generates comprehensive legal summaries
 
 import os
 import json
+import time
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from langchain.prompts import PromptTemplate
-from langchain.schema import HumanMessage, SystemMessage
-from openai import OpenAI
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import re
 
+from llm_gateway.cache import CachePolicy
+from llm_gateway.gateway import get_gateway
+
+from .cache import TTLCache
+from .text_cleaning import clean_text, clean_texts
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,11 +29,45 @@ logger = logging.getLogger(__name__)
 class LegalSummarizer:
     """AI-powered legal content summarizer with fallback LLM support"""
     
-    def __init__(self, groq_api_key: str = None, gemini_api_key: str = None):
+    # Model used on each provider for summarization
+    models = {"groq": "llama3-70b-8192", "gemini": "gemini-1.5-flash"}
+    # Citation extraction only restates the sources, so replies are reused for a week
+    citation_cache = CachePolicy(ttl_seconds=7 * 24 * 3600)
+    # Chunk summaries are query-independent, so overlapping results across queries reuse them
+    chunk_cache = CachePolicy(ttl_seconds=7 * 24 * 3600)
+    # Separator between partial summaries in reduce steps
+    partial_separator = "\n\n---\n\n"
+    
+    def __init__(
+        self,
+        groq_api_key: str = None,
+        gemini_api_key: str = None,
+        summary_cache: TTLCache = None,
+        citation_deadline: float = 45.0,
+        max_workers: int = 8,
+        map_reduce: bool = True,
+        max_content_chars: int = 8000,
+    ):
         self.groq_api_key = groq_api_key or os.getenv("GROQ_API_KEY")
         self.gemini_api_key = gemini_api_key or os.getenv("GEMINI_API_KEY")
         
+        # Citations run alongside the summary; after this many seconds (from the
+        # end of condensing) the summary is returned without them
+        self.citation_deadline = citation_deadline
+        
+        # Content longer than max_content_chars is map-reduced over all chunks
+        # (or, with map_reduce off, truncated to the first three chunks)
+        self.map_reduce = map_reduce
+        self.max_content_chars = max_content_chars
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="legal-summarizer")
+        # Citation calls get their own workers so a busy map-reduce cannot queue them
+        self.citation_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="legal-citations")
+        
+        # Summaries by (content hash, summary type, normalized question)
+        self.summary_cache = summary_cache or TTLCache(ttl_seconds=6 * 3600, max_entries=1024)
+        
         # Initialize LLMs
+        self.gateway = get_gateway()
         self.llms = self._initialize_llms()
         
         # Text splitter for long content
@@ -39,35 +80,12 @@ class LegalSummarizer:
         # Legal summarization prompts
         self.prompts = self._create_prompts()
         
-    def _initialize_llms(self) -> Dict:
-        """Initialize LLMs with fallback mechanism"""
-        llms = {}
-        
-        # Primary: Groq
-        if self.groq_api_key:
-            try:
-                llms['groq'] = ChatGroq(
-                    groq_api_key=self.groq_api_key,
-                    model_name="llama3-70b-8192",
-                    temperature=0.1,
-                    max_tokens=2000
-                )
-                logger.info("Groq LLM initialized for summarization")
-            except Exception as e:
-                logger.warning(f"Groq initialization failed: {e}")
-        
-        # Secondary: Gemini
-        if self.gemini_api_key:
-            try:
-                llms['gemini'] = ChatGoogleGenerativeAI(
-                    google_api_key=self.gemini_api_key,
-                    model="gemini-1.5-flash",
-                    temperature=0.1,
-                    max_output_tokens=2000
-                )
-                logger.info("Gemini LLM initialized for summarization")
-            except Exception as e:
-                logger.warning(f"Gemini initialization failed: {e}")
+    def _initialize_llms(self) -> List[str]:
+        """Providers used for summarization, in fallback order"""
+        # Clients, rate limits and failover are owned by the shared LLM gateway
+        llms = self.gateway.available_providers(["groq", "gemini"])
+        for llm_name in llms:
+            logger.info(f"{llm_name} LLM available for summarization")
         
         if not llms:
             raise Exception("No LLM available for summarization")
@@ -124,6 +142,35 @@ ANSWER:
             input_variables=["content", "query"]
         )
         
+        chunk_summary_prompt = PromptTemplate(
+            template="""
+You are a legal expert specializing in Canadian law. Summarize the legal content below in at most 200 words.
+
+CONTENT:
+{content}
+
+Keep every legal rule, definition and distinction it states, and keep the names of all statutes, cases and legal authorities it mentions.
+Do not add information that is not in the content.
+
+SUMMARY:
+""",
+            input_variables=["content"]
+        )
+        
+        combine_prompt = PromptTemplate(
+            template="""
+Combine these partial summaries of legal content into one consolidated summary of at most 400 words.
+
+PARTIAL SUMMARIES:
+{content}
+
+Merge overlapping points, keep every distinct legal rule and distinction, and keep the names of all statutes, cases and legal authorities.
+
+CONSOLIDATED SUMMARY:
+""",
+            input_variables=["content"]
+        )
+        
         citation_prompt = PromptTemplate(
             template="""
 Extract and format legal citations from this content. Focus on Canadian legal sources.
@@ -147,61 +194,96 @@ CITATIONS:
         return {
             "comprehensive": legal_summary_prompt,
             "quick": quick_answer_prompt,
-            "citations": citation_prompt
+            "citations": citation_prompt,
+            "chunk": chunk_summary_prompt,
+            "combine": combine_prompt
         }
     
     def _extract_clean_content(self, search_results: List[Dict]) -> str:
         """Extract and clean content from search results"""
-        combined_content = []
+        contents = [result.get("content", "") for result in search_results]
         
-        for result in search_results:
-            content = result.get("content", "")
-            if content:
-                # Clean the content
-                cleaned = self._clean_text(content)
-                if len(cleaned) > 100:  # Only include substantial content
-                    combined_content.append(cleaned)
+        # Clean the content in one batch; only include substantial content
+        cleaned = clean_texts(content for content in contents if content)
+        combined_content = [text for text in cleaned if len(text) > 100]
         
         return "\n\n---\n\n".join(combined_content)
     
     def _clean_text(self, text: str) -> str:
         """Clean and normalize text content"""
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Remove HTML-like tags if present
-        text = re.sub(r'<[^>]+>', '', text)
-        
-        # Remove URLs
-        text = re.sub(r'http[s]?://\S+', '', text)
-        
-        # Clean up special characters but keep legal punctuation
-        text = re.sub(r'[^\w\s\.,;:()"\'-]', '', text)
-        
-        return text.strip()
+        return clean_text(text)
+    
+    def _generate_with_fallback(self, prompt: str, cache: Optional[CachePolicy] = None) -> Optional[str]:
+        """Generate response with LLM fallback mechanism, optionally cached"""
+        try:
+            # Too-short replies are rejected so the gateway moves on to the next LLM
+            completion = self.gateway.complete(
+                prompt,
+                providers=self.llms,
+                models=self.models,
+                temperature=0.1,
+                max_tokens=2000,
+                accept=lambda content: len(content) > 50,
+                cache=cache,
+            )
+        except Exception as e:
+            logger.warning(f"Generation failed with all LLMs: {e}")
+            return None
+        
+        logger.info(f"Summary generated using {completion.provider}{' (cached)' if completion.cached else ''}")
+        return completion.content
+    
+    def _summarize_chunk(self, chunk: str) -> Optional[str]:
+        """Map step: query-independent summary of one chunk"""
+        return self._generate_with_fallback(self.prompts["chunk"].format(content=chunk), cache=self.chunk_cache)
+    
+    def _combine_summaries(self, partials: List[str]) -> Optional[str]:
+        """Reduce step: merge a group of partial summaries"""
+        return self._generate_with_fallback(
+            self.prompts["combine"].format(content=self.partial_separator.join(partials))
+        )
     
-    def _generate_with_fallback(self, prompt: str, max_retries: int = 2) -> Optional[str]:
-        """Generate response with LLM fallback mechanism"""
-        
-        for llm_name, llm in self.llms.items():
-            for attempt in range(max_retries):
-                try:
-                    response = llm.invoke([HumanMessage(content=prompt)])
-                    
-                    if hasattr(response, 'content'):
-                        content = response.content
-                    else:
-                        content = str(response)
-                    
-                    if content and len(content.strip()) > 50:
-                        logger.info(f"Summary generated using {llm_name} (attempt {attempt + 1})")
-                        return content.strip()
-                    
-                except Exception as e:
-                    logger.warning(f"Generation failed with {llm_name} (attempt {attempt + 1}): {e}")
-                    continue
-        
-        return None
+    def _group_partials(self, partials: List[str]) -> List[List[str]]:
+        """Pack consecutive partial summaries into groups that fit one reduce prompt"""
+        groups, group, size = [], [], 0
+        for partial in partials:
+            if group and size + len(partial) > self.max_content_chars:
+                groups.append(group)
+                group, size = [], 0
+            group.append(partial)
+            size += len(partial) + len(self.partial_separator)
+        if group:
+            groups.append(group)
+        return groups
+    
+    def _condense_content(self, content: str, max_rounds: int = 3) -> str:
+        """Map-reduce long content down to max_content_chars"""
+        chunks = self.text_splitter.split_text(content)
+        if not self.map_reduce:
+            return "\n\n".join(chunks[:3])  # Use first 3 chunks
+        
+        # Map: every chunk in parallel, bounded by the summarizer's thread pool
+        partials = [p for p in self.executor.map(self._summarize_chunk, chunks) if p]
+        if not partials:
+            logger.warning("Chunk summarization failed for every chunk, using the first 3 chunks")
+            return "\n\n".join(chunks[:3])
+        logger.info(f"Summarized {len(partials)}/{len(chunks)} chunks")
+        
+        # Reduce hierarchically until the partial summaries fit one prompt
+        for _ in range(max_rounds):
+            if len(partials) < 2 or len(self.partial_separator.join(partials)) <= self.max_content_chars:
+                break
+            groups = self._group_partials(partials)
+            reduced = list(self.executor.map(self._combine_summaries, groups))
+            partials = [r or self.partial_separator.join(g) for r, g in zip(reduced, groups)]
+            logger.info(f"Reduced to {len(partials)} partial summaries")
+        
+        return self.partial_separator.join(partials)[:self.max_content_chars]
+    
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """Whitespace-, case- and trailing-punctuation-insensitive form of a question"""
+        return re.sub(r"\s+", " ", query).strip().strip("?.!").strip().lower()
     
     def summarize_search_results(self, search_data: Dict, summary_type: str = "comprehensive") -> Dict:
         """Main method to summarize legal search results"""
@@ -235,10 +317,33 @@ CITATIONS:
                 "timestamp": datetime.now().isoformat()
             }
         
-        # Split content if too long
-        if len(content) > 8000:
-            chunks = self.text_splitter.split_text(content)
-            content = "\n\n".join(chunks[:3])  # Use first 3 chunks
+        # The summary answers the question, so the same content asked about
+        # differently is summarized again
+        cache_key = (
+            hashlib.sha256(content.encode("utf-8")).hexdigest(),
+            summary_type,
+            self._normalize_query(query),
+        )
+        cached = self.summary_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Serving {summary_type} summary from cache")
+            return {**cached, "query": query, "cached": True, "timestamp": datetime.now().isoformat()}
+        
+        content_length = len(content)
+        
+        # Condense content if too long
+        if len(content) > self.max_content_chars:
+            content = self._condense_content(content)
+        
+        # The citation deadline covers the summary call, not the condensing before it
+        started = time.monotonic()
+        # Citation extraction does not depend on the summary, so it runs concurrently
+        citation_future = None
+        if summary_type == "comprehensive":
+            citation_prompt = self.prompts["citations"].format(content=content)
+            citation_future = self.citation_executor.submit(
+                self._generate_with_fallback, citation_prompt, self.citation_cache
+            )
         
         # Generate summary based on type
         summary_prompt = self.prompts.get(summary_type, self.prompts["comprehensive"])
@@ -247,6 +352,8 @@ CITATIONS:
         summary = self._generate_with_fallback(prompt_text)
         
         if not summary:
+            if citation_future is not None:
+                citation_future.cancel()
             return {
                 "success": False,
                 "error": "Failed to generate summary with all available LLMs",
@@ -254,24 +361,36 @@ CITATIONS:
                 "timestamp": datetime.now().isoformat()
             }
         
-        # Generate citations if comprehensive summary
+        # Collect citations if comprehensive summary, up to the deadline
         citations = []
-        if summary_type == "comprehensive":
-            citation_prompt = self.prompts["citations"].format(content=content)
-            citation_text = self._generate_with_fallback(citation_prompt)
+        citations_timed_out = False
+        if citation_future is not None:
+            remaining = self.citation_deadline - (time.monotonic() - started)
+            try:
+                citation_text = citation_future.result(timeout=max(remaining, 0))
+            except FuturesTimeoutError:
+                # The call finishes in the background and still fills the completion cache
+                citation_text = None
+                citations_timed_out = True
+                logger.warning(f"Citation extraction missed the {self.citation_deadline}s deadline")
             if citation_text:
                 citations = self._parse_citations(citation_text)
         
-        return {
+        summary_data = {
             "success": True,
             "query": query,
             "summary": summary,
             "citations": citations,
             "summary_type": summary_type,
-            "content_length": len(content),
+            "content_length": content_length,
             "source_count": len(results),
             "timestamp": datetime.now().isoformat()
         }
+        if citations_timed_out:
+            summary_data["citations_timed_out"] = True
+        else:
+            self.summary_cache.set(cache_key, summary_data)
+        return summary_data
     
     def _parse_citations(self, citation_text: str) -> List[str]:
         """Parse citations from generated text"""
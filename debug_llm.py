@@ -14,7 +14,7 @@ def debug_llm():
         agent = LegalDocumentAgent()
         print('✅ LegalDocumentAgent initialized successfully')
         print(f'Model: {agent.model}')
-        print(f'Base URL: {agent.llm_client.base_url}')
+        print(f'Providers: {agent.gateway.available_providers()}')
         
         # Test simple LLM call first
         print('\n=== Testing Simple LLM Call ===')
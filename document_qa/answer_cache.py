@@ -0,0 +1,134 @@
+"""
+Semantic answer cache for the Document QA system.
+Serves near-duplicate questions (small rephrasings) from a stored answer
+instead of calling the LLM again.
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _CacheScope:
+    """Cached answers of one (collection, document filter) scope"""
+
+    def __init__(self, version: int):
+        self.version = version
+        self.entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.next_id = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+
+    def matrix(self):
+        """Stacked query embeddings, rebuilt only after the entries changed"""
+        if self._matrix is None:
+            self._matrix_ids = list(self.entries)
+            self._matrix = np.vstack([self.entries[i]["embedding"] for i in self._matrix_ids])
+        return self._matrix, self._matrix_ids
+
+    def changed(self):
+        self._matrix = None
+
+
+class SemanticAnswerCache:
+    """Answer cache keyed by (collection version, query embedding) with TTL/size eviction
+
+    A lookup hits when a stored query embedding of the same scope and collection
+    version has cosine similarity >= `similarity_threshold` with the new query.
+    Embeddings are expected to be normalized, so cosine is a dot product.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = 0.92,
+        ttl_seconds: float = 3600.0,
+        max_entries_per_scope: int = 256,
+        max_scopes: int = 1024,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_scope = max_entries_per_scope
+        self.max_scopes = max_scopes
+        self.hits = 0
+        self.misses = 0
+        self._scopes: "OrderedDict[Hashable, _CacheScope]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_scope(self, scope: Hashable, version: int, create: bool) -> Optional[_CacheScope]:
+        entry = self._scopes.get(scope)
+        if entry is not None and entry.version != version:
+            # The collection was re-indexed since these answers were stored
+            del self._scopes[scope]
+            entry = None
+        if entry is None and create:
+            entry = _CacheScope(version)
+            self._scopes[scope] = entry
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+        if entry is not None:
+            self._scopes.move_to_end(scope)
+        return entry
+
+    def _expire(self, entry: _CacheScope) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [i for i, item in entry.entries.items() if item["created_at"] < cutoff]
+        for i in expired:
+            del entry.entries[i]
+        if expired:
+            entry.changed()
+
+    def lookup(self, scope: Hashable, version: int, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Stored result of the most similar cached query above the threshold"""
+        with self._lock:
+            entry = self._get_scope(scope, version, create=False)
+            if entry is not None:
+                self._expire(entry)
+            if entry is None or not entry.entries:
+                self.misses += 1
+                return None
+            matrix, ids = entry.matrix()
+            similarities = matrix @ np.asarray(embedding, dtype=np.float32)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.entries.move_to_end(ids[best])
+            logger.info(f"Answer cache hit (similarity {similarities[best]:.3f})")
+            return entry.entries[ids[best]]["result"]
+
+    def store(self, scope: Hashable, version: int, embedding: List[float], result: Dict[str, Any]) -> None:
+        """Cache a result under its query embedding"""
+        with self._lock:
+            entry = self._get_scope(scope, version, create=True)
+            entry.entries[entry.next_id] = {
+                "embedding": np.asarray(embedding, dtype=np.float32),
+                "result": result,
+                "created_at": time.monotonic(),
+            }
+            entry.next_id += 1
+            while len(entry.entries) > self.max_entries_per_scope:
+                entry.entries.popitem(last=False)
+            entry.changed()
+
+    def invalidate(self, collection_name: str) -> None:
+        """Drop every scope of a collection"""
+        with self._lock:
+            for scope in [s for s in self._scopes if s[0] == collection_name]:
+                del self._scopes[scope]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "scopes": len(self._scopes),
+            "entries": sum(len(s.entries) for s in self._scopes.values()),
+        }
@@ -1,6 +1,14 @@
 import os
+import re
+import time
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional, Union
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Union
 from pathlib import Path
 import tempfile
 import chromadb
@@ -13,23 +21,32 @@ load_dotenv()
 # LangChain imports
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.documents import Document
-from langchain_openai import ChatOpenAI
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
 
 # LangGraph imports
 from langgraph.graph import StateGraph, END
 from langgraph.graph.state import CompiledStateGraph
 from typing_extensions import TypedDict
+from pydantic import ConfigDict
+
+from llm_gateway.chat_model import GatewayChatModel
+
+from .embedding_cache import EmbeddingCache
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion
+from .answer_cache import SemanticAnswerCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# doc_hash suffix of chunks embedded by a re-index that has not committed yet
+PENDING_HASH_SUFFIX = ":pending"
+
 class DocumentQAState(TypedDict):
     """State for the Document QA workflow"""
     documents: List[Document]
@@ -39,32 +56,80 @@ class DocumentQAState(TypedDict):
     error: Optional[str]
     embeddings_created: bool
     retriever_ready: bool
+    session_id: Optional[str]
+    doc_hash: Optional[str]
+    doc_key: Optional[str]
+    file_path: Optional[str]
+    file_type: Optional[str]
+    query_embedding: Optional[List[float]]
+
+def prefetch(iterable: Iterable, depth: int = 1) -> Iterator:
+    """Run an iterator in a background thread, keeping at most `depth` items buffered"""
+    buffer: "queue.Queue" = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+    
+    def put(item) -> bool:
+        # Give up once the consumer has gone away instead of blocking forever
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((done, e))
+    
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
 
 class DocumentProcessor:
     """Handles document loading and text splitting"""
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, page_window: int = 16):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        # Pages loaded, split and embedded together when streaming a document
+        self.page_window = page_window
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             length_function=len,
-            separators=["\n\n", "\n", " ", ""]
+            separators=["\n\n", "\n", " ", ""],
+            add_start_index=True
         )
     
+    def _get_loader(self, file_path: str, file_type: str):
+        """Pick the loader for a file type"""
+        if file_type.lower() == 'pdf':
+            return PyPDFLoader(file_path)
+        elif file_type.lower() in ['docx', 'doc']:
+            return Docx2txtLoader(file_path)
+        elif file_type.lower() == 'txt':
+            return TextLoader(file_path, encoding='utf-8')
+        raise ValueError(f"Unsupported file type: {file_type}")
+    
     def load_document(self, file_path: str, file_type: str) -> List[Document]:
         """Load document based on file type"""
         try:
-            if file_type.lower() == 'pdf':
-                loader = PyPDFLoader(file_path)
-            elif file_type.lower() in ['docx', 'doc']:
-                loader = Docx2txtLoader(file_path)
-            elif file_type.lower() == 'txt':
-                loader = TextLoader(file_path, encoding='utf-8')
-            else:
-                raise ValueError(f"Unsupported file type: {file_type}")
-            
+            loader = self._get_loader(file_path, file_type)
             documents = loader.load()
             logger.info(f"Loaded {len(documents)} pages from {file_path}")
             return documents
@@ -73,28 +138,177 @@ class DocumentProcessor:
             logger.error(f"Error loading document: {e}")
             raise
     
-    def split_documents(self, documents: List[Document]) -> List[Document]:
+    def iter_pages(self, file_path: str, file_type: str) -> Iterator[Document]:
+        """Yield pages one at a time instead of loading the whole document"""
+        loader = self._get_loader(file_path, file_type)
+        yield from loader.lazy_load()
+    
+    def iter_chunk_windows(
+        self,
+        file_path: str,
+        file_type: str,
+        doc_key: Optional[str] = None
+    ) -> Iterator[List[Document]]:
+        """Yield the chunks of each window of `page_window` pages"""
+        window: List[Document] = []
+        pages = 0
+        for page in self.iter_pages(file_path, file_type):
+            window.append(page)
+            pages += 1
+            if len(window) >= self.page_window:
+                yield self.split_documents(window, doc_key=doc_key)
+                window = []
+        if window:
+            yield self.split_documents(window, doc_key=doc_key)
+        logger.info(f"Streamed {pages} pages from {file_path}")
+    
+    @staticmethod
+    def compute_file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+        """Hash the raw file bytes; the digest addresses the document's vector index"""
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                sha256.update(block)
+        return sha256.hexdigest()
+    
+    def split_documents(self, documents: List[Document], doc_key: Optional[str] = None) -> List[Document]:
         """Split documents into chunks"""
         try:
             chunks = self.text_splitter.split_documents(documents)
+            if doc_key:
+                self.assign_chunk_ids(chunks, doc_key)
             logger.info(f"Split documents into {len(chunks)} chunks")
             return chunks
         except Exception as e:
             logger.error(f"Error splitting documents: {e}")
             raise
+    
+    @staticmethod
+    def assign_chunk_ids(chunks: List[Document], doc_key: str) -> List[Document]:
+        """Give each chunk a stable ID built from page, offset and content hash"""
+        key_hash = hashlib.sha256(doc_key.encode("utf-8")).hexdigest()[:16]
+        for chunk in chunks:
+            text_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()[:16]
+            page = chunk.metadata.get("page", 0)
+            offset = chunk.metadata.get("start_index", 0)
+            chunk.metadata["chunk_id"] = f"{key_hash}:{page}:{offset}:{text_hash}"
+        return chunks
+
+class HybridRetriever(BaseRetriever):
+    """Dense vector and BM25 lexical retrieval fused with reciprocal rank fusion"""
+    
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    
+    collection: Any
+    embeddings: Any
+    lexical_index: Any
+    k: int = 5
+    fetch_k: int = 20
+    rrf_k: int = 60
+    doc_hash: Optional[str] = None
+    
+    def retrieve(self, query: str, query_embedding: Optional[List[float]] = None) -> List[Document]:
+        """Fuse the top `fetch_k` hits of both rankers and keep the best `k`"""
+        where = {"doc_hash": self.doc_hash} if self.doc_hash else None
+        if query_embedding is None:
+            query_embedding = self.embeddings.embed_query(query)
+        
+        dense = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=self.fetch_k,
+            where=where,
+            include=["documents", "metadatas"]
+        )
+        dense_ids = dense["ids"][0]
+        documents = {
+            chunk_id: Document(page_content=text, metadata=metadata or {})
+            for chunk_id, text, metadata in zip(dense_ids, dense["documents"][0], dense["metadatas"][0])
+        }
+        lexical_ids = [
+            chunk_id for chunk_id, _ in self.lexical_index.search(query, k=self.fetch_k, where=where)
+        ]
+        
+        results = []
+        for chunk_id in reciprocal_rank_fusion([dense_ids, lexical_ids], k=self.rrf_k):
+            if chunk_id not in documents:
+                try:
+                    text, metadata = self.lexical_index.get(chunk_id)
+                except KeyError:
+                    # Removed by a concurrent re-index
+                    continue
+                documents[chunk_id] = Document(page_content=text, metadata=dict(metadata))
+            results.append(documents[chunk_id])
+            if len(results) == self.k:
+                break
+        return results
+    
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.retrieve(query)
+
+class CollectionHandle:
+    """Open collection/retriever pair for one session (optionally one document)"""
+    
+    def __init__(self, collection, retriever: HybridRetriever):
+        self.collection = collection
+        self.retriever = retriever
+        self.last_used = time.monotonic()
+    
+    def touch(self):
+        self.last_used = time.monotonic()
 
 class VectorStoreManager:
     """Manages vector store operations with ChromaDB"""
     
-    def __init__(self, collection_name: str = "document_qa", persist_directory: str = "./chroma_db"):
+    def __init__(
+        self,
+        collection_name: str = "document_qa",
+        persist_directory: str = "./chroma_db",
+        max_open_handles: int = 64,
+        handle_idle_timeout: float = 900.0,
+        embed_batch_size: int = 64,
+        embed_workers: Optional[int] = None,
+        write_batch_size: int = 1024,
+        embedding_cache_size: int = 200_000
+    ):
+        # Used as the prefix of every session collection name
         self.collection_name = collection_name
         self.persist_directory = persist_directory
+        
+        # Ingestion: chunks are embedded in batches across a worker pool
+        # sized to the machine, then written to Chroma in bulk
+        self.embed_batch_size = embed_batch_size
+        self.embed_workers = embed_workers or os.cpu_count() or 1
+        self.write_batch_size = write_batch_size
+        self.last_ingest_stats: Dict[str, float] = {}
         self.embeddings = self._initialize_embeddings()
-        self.vectorstore = None
-        self.retriever = None
         
         # Ensure persist directory exists
         os.makedirs(persist_directory, exist_ok=True)
+        
+        # Recurring clauses are embedded once, keyed by their normalized text
+        self.embedding_cache = EmbeddingCache(
+            os.path.join(persist_directory, "embedding_cache.sqlite3"),
+            model_name=self.embeddings.model_name,
+            max_entries=embedding_cache_size
+        )
+        
+        # LRU of open collection/retriever handles keyed by (session, document)
+        self.max_open_handles = max_open_handles
+        self.handle_idle_timeout = handle_idle_timeout
+        self._handles: "OrderedDict[Tuple[str, Optional[str]], CollectionHandle]" = OrderedDict()
+        self._handles_lock = threading.Lock()
+        # BM25 index per open collection, shared by that collection's handles
+        self._lexical_indexes: Dict[str, LexicalIndex] = {}
+        # Bumped on every write so caches can tell a collection was re-indexed
+        self._versions: Dict[str, int] = {}
+        
+        # One persistent client shared by every collection
+        self.client = chromadb.PersistentClient(
+            path=self.persist_directory,
+            settings=Settings(anonymized_telemetry=False)
+        )
     
     def _initialize_embeddings(self) -> HuggingFaceEmbeddings:
         """Initialize HuggingFace embeddings"""
@@ -102,7 +316,10 @@ class VectorStoreManager:
             embeddings = HuggingFaceEmbeddings(
                 model_name="sentence-transformers/all-MiniLM-L6-v2",
                 model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': True}
+                encode_kwargs={
+                    'normalize_embeddings': True,
+                    'batch_size': self.embed_batch_size
+                }
             )
             logger.info("HuggingFace embeddings initialized successfully")
             return embeddings
@@ -110,54 +327,381 @@ class VectorStoreManager:
             logger.error(f"Error initializing embeddings: {e}")
             raise
     
-    def create_vectorstore(self, documents: List[Document]) -> bool:
-        """Create or update vector store with documents"""
+    def collection_name_for(self, session_id: Optional[str] = None) -> str:
+        """Session-scoped collection name"""
+        key = str(session_id) if session_id not in (None, "") else "default"
+        # Chroma collection names are limited to 63 [a-zA-Z0-9_-] characters
+        if not re.fullmatch(r"[A-Za-z0-9_-]{1,40}", key):
+            key = hashlib.sha256(key.encode("utf-8")).hexdigest()[:40]
+        return f"{self.collection_name}_{key}"
+    
+    def _get_collection(self, session_id: Optional[str] = None):
+        """Raw Chroma collection for a session, or None if it was never created"""
+        try:
+            return self.client.get_collection(self.collection_name_for(session_id))
+        except Exception:
+            return None
+    
+    def _get_or_create_collection(self, session_id: Optional[str] = None):
+        """Raw Chroma collection for a session, created on first use"""
+        # Embeddings are always supplied explicitly, so no collection-side function
+        return self.client.get_or_create_collection(
+            name=self.collection_name_for(session_id),
+            embedding_function=None
+        )
+    
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, serving repeated chunks from the embedding cache"""
+        if not texts:
+            return []
+        keys = [self.embedding_cache.key_for(text) for text in texts]
+        vectors = self.embedding_cache.get_many(keys)
+        
+        # Embed each distinct uncached text once
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                pending.setdefault(key, text)
+        if pending:
+            computed = dict(zip(pending, self._embed_uncached(list(pending.values()))))
+            self.embedding_cache.put_many(computed)
+            vectors.update(computed)
+        
+        return [vectors[key] for key in keys]
+    
+    def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in batches spread over the worker pool, preserving order"""
+        if not texts:
+            return []
+        batches = [
+            texts[i:i + self.embed_batch_size]
+            for i in range(0, len(texts), self.embed_batch_size)
+        ]
+        if len(batches) == 1 or self.embed_workers == 1:
+            vectors = [self.embeddings.embed_documents(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.embed_workers, len(batches))) as pool:
+                vectors = list(pool.map(self.embeddings.embed_documents, batches))
+        return [vector for batch in vectors for vector in batch]
+    
+    def ingest_documents(
+        self,
+        documents: List[Document],
+        session_id: Optional[str] = None,
+        ids: Optional[List[str]] = None
+    ) -> Dict[str, float]:
+        """Embed chunks and write them to the session collection in bulk add calls"""
+        collection = self._get_or_create_collection(session_id)
+        ids = ids or [uuid.uuid4().hex for _ in documents]
+        started = time.perf_counter()
+        
+        for start in range(0, len(documents), self.write_batch_size):
+            batch = documents[start:start + self.write_batch_size]
+            texts = [document.page_content for document in batch]
+            batch_ids = ids[start:start + len(batch)]
+            metadatas = [document.metadata for document in batch]
+            collection.add(
+                ids=batch_ids,
+                embeddings=self.embed_texts(texts),
+                documents=texts,
+                metadatas=metadatas
+            )
+            lexical_index = self._loaded_lexical_index(session_id)
+            if lexical_index is not None:
+                lexical_index.add(batch_ids, texts, metadatas)
+            self._bump_version(session_id)
+        
+        elapsed = time.perf_counter() - started
+        stats = {
+            "chunks": len(documents),
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(len(documents) / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        self.last_ingest_stats = stats
+        logger.info(
+            f"Embedded {stats['chunks']} chunks in {stats['seconds']}s "
+            f"({stats['chunks_per_sec']} chunks/sec, {self.embed_workers} workers, "
+            f"batch size {self.embed_batch_size}), cache: {self.embedding_cache.stats()}"
+        )
+        return stats
+    
+    def collection_version(self, session_id: Optional[str] = None) -> int:
+        """Write counter of a session collection (in-process)"""
+        return self._versions.get(self.collection_name_for(session_id), 0)
+    
+    def _bump_version(self, session_id: Optional[str] = None):
+        name = self.collection_name_for(session_id)
+        self._versions[name] = self._versions.get(name, 0) + 1
+    
+    def has_documents(self, session_id: Optional[str] = None) -> bool:
+        """Check whether the session has any embedded documents"""
+        collection = self._get_collection(session_id)
+        return bool(collection and collection.count() > 0)
+    
+    def is_indexed(self, doc_hash: str, session_id: Optional[str] = None) -> bool:
+        """Check whether a document with this content hash is completely embedded
+        
+        Every chunk of the document must carry the hash: a re-index that is still
+        running, or that crashed before committing, leaves chunks with the
+        previous or a pending hash and does not count.
+        """
+        collection = self._get_collection(session_id)
+        if collection is None:
+            return False
+        found = collection.get(where={"doc_hash": doc_hash}, limit=1, include=["metadatas"])
+        if not found["ids"]:
+            return False
+        doc_key = found["metadatas"][0].get("doc_key")
+        if doc_key is None:
+            return True
+        other = collection.get(
+            where={"$and": [{"doc_key": doc_key}, {"doc_hash": {"$ne": doc_hash}}]},
+            limit=1,
+            include=[],
+        )
+        return not other["ids"]
+    
+    def _evict_idle_handles(self):
+        """Drop handles idle past the timeout, then trim the LRU to its bound"""
+        now = time.monotonic()
+        for key in [k for k, h in self._handles.items() if now - h.last_used > self.handle_idle_timeout]:
+            del self._handles[key]
+        while len(self._handles) > self.max_open_handles:
+            self._handles.popitem(last=False)
+        open_collections = {name for name, _ in self._handles}
+        for name in [n for n in self._lexical_indexes if n not in open_collections]:
+            del self._lexical_indexes[name]
+    
+    def _build_lexical_index(self, collection, page_size: int = 1000) -> LexicalIndex:
+        """Build the BM25 index of a collection from its stored chunk texts"""
+        index = LexicalIndex()
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            index.add(page["ids"], page["documents"], page["metadatas"])
+        logger.info(f"Built lexical index for '{collection.name}' with {len(index)} chunks")
+        return index
+    
+    def _loaded_lexical_index(self, session_id: Optional[str] = None) -> Optional[LexicalIndex]:
+        """Lexical index of a session if currently open; kept in sync on writes"""
+        return self._lexical_indexes.get(self.collection_name_for(session_id))
+    
+    def _get_handle(self, session_id: Optional[str] = None, doc_hash: Optional[str] = None) -> CollectionHandle:
+        """Get or open the handle for a session, optionally narrowed to one document"""
+        key = (self.collection_name_for(session_id), doc_hash)
+        with self._handles_lock:
+            handle = self._handles.get(key)
+            if handle is not None:
+                handle.touch()
+                self._handles.move_to_end(key)
+                return handle
+            
+            collection = self._get_or_create_collection(session_id)
+            lexical_index = self._lexical_indexes.get(key[0])
+            if lexical_index is None:
+                lexical_index = self._build_lexical_index(collection)
+                self._lexical_indexes[key[0]] = lexical_index
+            retriever = HybridRetriever(
+                collection=collection,
+                embeddings=self.embeddings,
+                lexical_index=lexical_index,
+                k=5,
+                doc_hash=doc_hash
+            )
+            handle = CollectionHandle(collection, retriever)
+            self._handles[key] = handle
+            self._evict_idle_handles()
+            return handle
+    
+    def create_vectorstore(
+        self,
+        documents: List[Document],
+        session_id: Optional[str] = None,
+        doc_hash: Optional[str] = None,
+        doc_key: Optional[str] = None
+    ) -> bool:
+        """Embed documents into the session's collection"""
         try:
             if not documents:
                 raise ValueError("No documents provided")
             
-            # Create ChromaDB client
-            client = chromadb.PersistentClient(
-                path=self.persist_directory,
-                settings=Settings(anonymized_telemetry=False)
-            )
+            if doc_key:
+                stats = self.upsert_document(documents, doc_key, session_id=session_id, doc_hash=doc_hash)
+                logger.info(f"Re-indexed '{doc_key}' in '{self.collection_name_for(session_id)}': {stats}")
+                return True
             
-            # Create vector store
-            self.vectorstore = Chroma.from_documents(
-                documents=documents,
-                embedding=self.embeddings,
-                collection_name=self.collection_name,
-                persist_directory=self.persist_directory,
-                client=client
-            )
+            if doc_hash:
+                for document in documents:
+                    document.metadata["doc_hash"] = doc_hash
             
-            # Create retriever
-            self.retriever = self.vectorstore.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": 5}
-            )
+            self.ingest_documents(documents, session_id=session_id)
             
-            logger.info(f"Vector store created with {len(documents)} documents")
+            logger.info(
+                f"Added {len(documents)} documents to collection "
+                f"'{self.collection_name_for(session_id)}'"
+            )
             return True
             
         except Exception as e:
             logger.error(f"Error creating vector store: {e}")
+            # Never leave a partially embedded document behind: it would be
+            # mistaken for a complete index on the next lookup
+            collection = self._get_collection(session_id)
+            if collection is not None and doc_hash and not doc_key:
+                try:
+                    partial = collection.get(where={"doc_hash": doc_hash}, include=[])["ids"]
+                    self._delete_chunks(collection, partial, session_id)
+                except Exception:
+                    pass
             return False
     
-    def get_retriever(self):
-        """Get the retriever instance"""
-        if not self.retriever:
+    def _delete_chunks(self, collection, ids: List[str], session_id: Optional[str] = None):
+        """Delete chunks from the collection and its lexical index"""
+        if not ids:
+            return
+        collection.delete(ids=ids)
+        lexical_index = self._loaded_lexical_index(session_id)
+        if lexical_index is not None:
+            lexical_index.remove(ids)
+        self._bump_version(session_id)
+    
+    def _update_metadatas(
+        self,
+        collection,
+        ids: List[str],
+        metadatas: List[Dict[str, Any]],
+        session_id: Optional[str] = None
+    ):
+        """Replace chunk metadata in the collection and its lexical index"""
+        collection.update(ids=ids, metadatas=metadatas)
+        lexical_index = self._loaded_lexical_index(session_id)
+        if lexical_index is not None:
+            lexical_index.update_metadata(ids, metadatas)
+        self._bump_version(session_id)
+    
+    def upsert_document(
+        self,
+        chunks: List[Document],
+        doc_key: str,
+        session_id: Optional[str] = None,
+        doc_hash: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Bring a document's chunks in the collection in line with a new version
+        
+        Chunks are diffed by their stable chunk IDs: only added or changed chunks
+        are embedded, removed ones are deleted, unchanged ones only get their
+        metadata moved to the new version.
+        """
+        return self.upsert_document_stream([chunks], doc_key, session_id=session_id, doc_hash=doc_hash)
+    
+    def upsert_document_stream(
+        self,
+        chunk_windows: Iterable[List[Document]],
+        doc_key: str,
+        session_id: Optional[str] = None,
+        doc_hash: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Incremental upsert fed one window of chunks at a time
+        
+        Only chunk IDs and the metadata of unchanged chunks are held for the
+        whole document, so memory is bounded by the window size rather than
+        the document size. New chunks are written under a pending hash, and
+        they and the unchanged chunks get the new hash only once every window
+        has been embedded, so a failed re-index leaves the previous version
+        intact. Until that commit has finished, is_indexed() reports the new
+        hash as not indexed, even after a crash that skipped the rollback.
+        """
+        collection = self._get_or_create_collection(session_id)
+        existing_ids = set(collection.get(where={"doc_key": doc_key}, include=[])["ids"])
+        seen_ids = set()
+        added_ids: List[str] = []
+        # chunk_id -> new metadata, applied after the last window
+        kept_metadatas: Dict[str, Dict[str, Any]] = {}
+        # chunk_id -> previous metadata of chunks already moved, for rollback
+        previous_metadatas: Dict[str, Dict[str, Any]] = {}
+        
+        try:
+            for chunks in chunk_windows:
+                new_chunks = {}
+                for chunk in chunks:
+                    chunk.metadata["doc_key"] = doc_key
+                    if doc_hash:
+                        chunk.metadata["doc_hash"] = doc_hash
+                    new_chunks[chunk.metadata["chunk_id"]] = chunk
+                window_added = [chunk_id for chunk_id in new_chunks if chunk_id not in existing_ids and chunk_id not in seen_ids]
+                seen_ids.update(new_chunks)
+                
+                for chunk_id, chunk in new_chunks.items():
+                    if chunk_id in existing_ids:
+                        kept_metadatas[chunk_id] = dict(chunk.metadata)
+                if window_added:
+                    if doc_hash:
+                        for chunk_id in window_added:
+                            new_chunks[chunk_id].metadata["doc_hash"] = doc_hash + PENDING_HASH_SUFFIX
+                    self.ingest_documents(
+                        [new_chunks[chunk_id] for chunk_id in window_added],
+                        session_id=session_id,
+                        ids=window_added
+                    )
+                    added_ids.extend(window_added)
+            
+            kept_ids = list(kept_metadatas)
+            for start in range(0, len(kept_ids), self.write_batch_size):
+                batch_ids = kept_ids[start:start + self.write_batch_size]
+                previous = collection.get(ids=batch_ids, include=["metadatas"])
+                previous_metadatas.update(zip(previous["ids"], previous["metadatas"]))
+                self._update_metadatas(
+                    collection, batch_ids, [kept_metadatas[chunk_id] for chunk_id in batch_ids], session_id
+                )
+            if doc_hash:
+                for start in range(0, len(added_ids), self.write_batch_size):
+                    batch_ids = added_ids[start:start + self.write_batch_size]
+                    pending = collection.get(ids=batch_ids, include=["metadatas"])
+                    self._update_metadatas(
+                        collection,
+                        pending["ids"],
+                        [{**metadata, "doc_hash": doc_hash} for metadata in pending["metadatas"]],
+                        session_id
+                    )
+        except Exception:
+            # Roll back to the previous version: drop new chunks, restore moved ones
+            if previous_metadatas:
+                self._update_metadatas(
+                    collection, list(previous_metadatas), list(previous_metadatas.values()), session_id
+                )
+            if added_ids:
+                self._delete_chunks(collection, added_ids, session_id)
+            raise
+        
+        removed_ids = list(existing_ids.difference(seen_ids))
+        if removed_ids:
+            self._delete_chunks(collection, removed_ids, session_id)
+        
+        return {
+            "added": len(added_ids),
+            "unchanged": len(kept_metadatas),
+            "deleted": len(removed_ids),
+        }
+    
+    def get_retriever(self, session_id: Optional[str] = None, doc_hash: Optional[str] = None):
+        """Get the retriever for a session, optionally restricted to one document"""
+        if not self.has_documents(session_id):
             raise ValueError("Vector store not initialized. Call create_vectorstore first.")
-        return self.retriever
+        return self._get_handle(session_id, doc_hash).retriever
+    
+    def close_session(self, session_id: Optional[str] = None):
+        """Release every open handle belonging to a session"""
+        name = self.collection_name_for(session_id)
+        with self._handles_lock:
+            for key in [k for k in self._handles if k[0] == name]:
+                del self._handles[key]
 
 class LLMManager:
     """Manages OpenRouter DeepSeek LLM instance for RAG system"""
     def __init__(self):
-        # OpenRouter DeepSeek via OpenAI-compatible API
-        self.primary_llm = ChatOpenAI(
-            openai_api_key=os.getenv("OPENROUTER_API_KEY"),
-            openai_api_base="https://openrouter.ai/api/v1",
-            model="deepseek-chat",
+        # OpenRouter DeepSeek through the shared gateway (fails over to the other providers)
+        self.primary_llm = GatewayChatModel(
+            models={"openrouter": "deepseek-chat"},
             temperature=0.3,
             max_tokens=500
         )
@@ -185,6 +729,18 @@ class DocumentQARAG:
         "\n\n"
         "{context}"
 )
+        # Built once and reused: the chain stuffs already-retrieved context into the prompt
+        self.answer_chain = self._create_answer_chain()
+        # Near-duplicate questions against an unchanged collection skip the LLM
+        self.answer_cache = SemanticAnswerCache()
+    
+    def _create_answer_chain(self):
+        """Create the reusable prompt -> LLM answer chain"""
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", self.system_prompt),
+            ("human", "{input}"),
+        ])
+        return create_stuff_documents_chain(self.llm_manager.get_llm(), prompt)
     
     def _create_workflow(self) -> CompiledStateGraph:
         """Create LangGraph workflow"""
@@ -209,7 +765,9 @@ class DocumentQARAG:
         """Process and chunk documents"""
         try:
             if state.get("documents"):
-                chunks = self.document_processor.split_documents(state["documents"])
+                chunks = self.document_processor.split_documents(
+                    state["documents"], doc_key=state.get("doc_key")
+                )
                 state["documents"] = chunks
                 logger.info("Documents processed successfully")
             return state
@@ -221,10 +779,29 @@ class DocumentQARAG:
     def _create_embeddings(self, state: DocumentQAState) -> DocumentQAState:
         """Create vector embeddings"""
         try:
-            if state.get("documents") and not state.get("error"):
-                success = self.vector_manager.create_vectorstore(state["documents"])
+            if state.get("file_path") and not state.get("documents") and not state.get("error"):
+                # Large files are streamed page window by page window
+                self._stream_index(
+                    state["file_path"],
+                    state["file_type"],
+                    state.get("doc_key") or os.path.basename(state["file_path"]),
+                    state.get("session_id"),
+                    state.get("doc_hash")
+                )
+                state["embeddings_created"] = True
+                state["retriever_ready"] = True
+                self._invalidate_answers(state.get("session_id"))
+                logger.info("Embeddings created successfully")
+            elif state.get("documents") and not state.get("error"):
+                success = self.vector_manager.create_vectorstore(
+                    state["documents"],
+                    session_id=state.get("session_id"),
+                    doc_hash=state.get("doc_hash"),
+                    doc_key=state.get("doc_key")
+                )
                 state["embeddings_created"] = success
                 state["retriever_ready"] = success
+                self._invalidate_answers(state.get("session_id"))
                 if success:
                     logger.info("Embeddings created successfully")
                 else:
@@ -239,8 +816,10 @@ class DocumentQARAG:
         """Retrieve relevant context"""
         try:
             if state.get("retriever_ready") and state.get("query") and not state.get("error"):
-                retriever = self.vector_manager.get_retriever()
-                context = retriever.invoke(state["query"])
+                retriever = self.vector_manager.get_retriever(
+                    state.get("session_id"), state.get("doc_hash")
+                )
+                context = retriever.retrieve(state["query"], state.get("query_embedding"))
                 state["context"] = context
                 logger.info(f"Retrieved {len(context)} context documents")
             return state
@@ -253,21 +832,12 @@ class DocumentQARAG:
         """Generate answer using OpenRouter DeepSeek LLM"""
         try:
             if state.get("context") and state.get("query") and not state.get("error"):
-                llm = self.llm_manager.get_llm()
-                
-                prompt = ChatPromptTemplate.from_messages([
-                    ("system", self.system_prompt),
-                    ("human", "{input}"),
-                ])
-                
-                question_answer_chain = create_stuff_documents_chain(llm, prompt)
-                rag_chain = create_retrieval_chain(
-                    self.vector_manager.get_retriever(), 
-                    question_answer_chain
-                )
-                
-                response = rag_chain.invoke({"input": state["query"]})
-                state["answer"] = response.get("answer", "No answer generated")
+                # Answer from the context retrieve_context already fetched; no second search
+                answer = self.answer_chain.invoke({
+                    "input": state["query"],
+                    "context": state["context"]
+                })
+                state["answer"] = answer or "No answer generated"
                 state["error"] = None
                 logger.info("Answer generated using OpenRouter DeepSeek LLM")
                 
@@ -277,21 +847,92 @@ class DocumentQARAG:
             logger.error(state["error"])
             return state
     
-    def process_document_and_query(self, file_path: str, file_type: str, query: str) -> Dict[str, Any]:
+    def index_document(
+        self,
+        file_path: str,
+        file_type: str,
+        session_id: Optional[str] = None,
+        doc_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Index a document without querying it, re-embedding only changed chunks"""
+        doc_key = doc_key or os.path.basename(file_path)
+        doc_hash = self.document_processor.compute_file_hash(file_path)
+        if self.vector_manager.is_indexed(doc_hash, session_id=session_id):
+            logger.info(f"Document {file_path} already indexed, skipping embedding")
+            return {"success": True, "doc_hash": doc_hash, "added": 0, "unchanged": None, "deleted": 0}
+        
+        stats = self._stream_index(file_path, file_type, doc_key, session_id, doc_hash)
+        self._invalidate_answers(session_id)
+        return {"success": True, "doc_hash": doc_hash, **stats}
+    
+    def _invalidate_answers(self, session_id: Optional[str] = None):
+        """Forget cached answers of a session whose collection was re-indexed"""
+        self.answer_cache.invalidate(self.vector_manager.collection_name_for(session_id))
+    
+    @staticmethod
+    def _sources_from_context(context: List[Document]) -> List[Dict[str, Any]]:
+        """Source references of the chunks an answer was grounded in"""
+        return [
+            {
+                "source": document.metadata.get("source"),
+                "page": document.metadata.get("page"),
+                "chunk_id": document.metadata.get("chunk_id"),
+            }
+            for document in context
+        ]
+    
+    def _stream_index(
+        self,
+        file_path: str,
+        file_type: str,
+        doc_key: str,
+        session_id: Optional[str],
+        doc_hash: str
+    ) -> Dict[str, int]:
+        """Load, split and embed a document as a pipeline of page windows"""
+        # Loading/splitting the next window overlaps with embedding the current one
+        chunk_windows = prefetch(
+            self.document_processor.iter_chunk_windows(file_path, file_type, doc_key=doc_key)
+        )
+        stats = self.vector_manager.upsert_document_stream(
+            chunk_windows, doc_key, session_id=session_id, doc_hash=doc_hash
+        )
+        if not stats["added"] and not stats["unchanged"]:
+            raise ValueError(f"No text could be extracted from {file_path}")
+        logger.info(f"Indexed {file_path} for session {session_id}: {stats}")
+        return stats
+    
+    def process_document_and_query(
+        self,
+        file_path: str,
+        file_type: str,
+        query: str,
+        session_id: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Process document and answer query"""
         try:
-            # Load documents
-            documents = self.document_processor.load_document(file_path, file_type)
+            # Documents are indexed by content: identical bytes are embedded once per session
+            doc_hash = self.document_processor.compute_file_hash(file_path)
+            if self.vector_manager.is_indexed(doc_hash, session_id=session_id):
+                logger.info(f"Document {file_path} already indexed, skipping embedding")
+                return self.query_existing_documents(query, session_id=session_id, doc_hash=doc_hash)
             
-            # Initialize state
+            # Initialize state; pages are streamed from the file during embedding
             initial_state = DocumentQAState(
-                documents=documents,
+                documents=[],
                 query=query,
                 context=[],
                 answer="",
                 error=None,
                 embeddings_created=False,
-                retriever_ready=False
+                retriever_ready=False,
+                session_id=session_id,
+                doc_hash=doc_hash,
+                # Re-uploads of the same file name are diffed against the previous version
+                doc_key=os.path.basename(file_path),
+                file_path=file_path,
+                file_type=file_type,
+                query_embedding=None
             )
             
             # Run workflow
@@ -300,7 +941,8 @@ class DocumentQARAG:
             return {
                 "answer": final_state.get("answer", "No answer generated"),
                 "error": final_state.get("error"),
-                "success": bool(final_state.get("answer") and not final_state.get("error"))
+                "success": bool(final_state.get("answer") and not final_state.get("error")),
+                "sources": self._sources_from_context(final_state.get("context", []))
             }
             
         except Exception as e:
@@ -311,16 +953,29 @@ class DocumentQARAG:
                 "success": False
             }
     
-    def query_existing_documents(self, query: str) -> Dict[str, Any]:
-        """Query against already processed documents"""
+    def query_existing_documents(
+        self,
+        query: str,
+        session_id: Optional[str] = None,
+        doc_hash: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Query against already processed documents of a session"""
         try:
-            if not self.vector_manager.retriever:
+            if not self.vector_manager.has_documents(session_id):
                 return {
                     "answer": "",
                     "error": "No documents loaded. Please upload a document first.",
                     "success": False
                 }
             
+            # Serve rephrasings of an already answered question from the cache
+            scope = (self.vector_manager.collection_name_for(session_id), doc_hash)
+            version = self.vector_manager.collection_version(session_id)
+            query_embedding = self.vector_manager.embeddings.embed_query(query)
+            cached = self.answer_cache.lookup(scope, version, query_embedding)
+            if cached is not None:
+                return {**cached, "cached": True}
+            
             initial_state = DocumentQAState(
                 documents=[],
                 query=query,
@@ -328,18 +983,28 @@ class DocumentQARAG:
                 answer="",
                 error=None,
                 embeddings_created=True,
-                retriever_ready=True
+                retriever_ready=True,
+                session_id=session_id,
+                doc_hash=doc_hash,
+                doc_key=None,
+                file_path=None,
+                file_type=None,
+                query_embedding=query_embedding
             )
             
             # Skip document processing and embedding creation
             state = self._retrieve_context(initial_state)
             state = self._generate_answer(state)
             
-            return {
+            result = {
                 "answer": state.get("answer", "No answer generated"),
                 "error": state.get("error"),
-                "success": bool(state.get("answer") and not state.get("error"))
+                "success": bool(state.get("answer") and not state.get("error")),
+                "sources": self._sources_from_context(state.get("context", []))
             }
+            if result["success"]:
+                self.answer_cache.store(scope, version, query_embedding, result)
+            return result
             
         except Exception as e:
             logger.error(f"Query execution error: {e}")
@@ -0,0 +1,216 @@
+"""
+In-memory BM25 inverted index for the Document QA system.
+Built alongside each Chroma collection so exact legal terms (section numbers,
+defined terms, party names) can be matched lexically.
+"""
+
+import re
+import math
+import heapq
+import threading
+from collections import Counter
+from operator import itemgetter
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+# Keeps "12.3", "non-compete" and "s/n" together as single tokens
+_TOKEN = re.compile(r"\w+(?:[.\-/']\w+)*")
+_TOKEN_PARTS = re.compile(r"[.\-/']")
+
+
+# Function words that carry no lexical signal; never indexed or scored
+STOPWORDS = frozenset(
+    "a about above after again against all am an and any are as at be because been before being "
+    "below between both but by can could did do does doing down during each few for from further "
+    "had has have having he her here hers herself him himself his how i if in into is it its itself "
+    "just me more most my myself no nor not now of off on once only or other our ours ourselves out "
+    "over own same she should so some such than that the their theirs them themselves then there "
+    "these they this those through to too under until up very was we were what when where which "
+    "while who whom why will with would you your yours yourself yourselves".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens without stopwords; compound tokens are also indexed by their parts"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if _TOKEN_PARTS.search(token):
+            tokens.extend(
+                part for part in _TOKEN_PARTS.split(token) if part and part not in STOPWORDS
+            )
+    return tokens
+
+
+class LexicalIndex:
+    """BM25-scored inverted index over chunk texts keyed by chunk ID"""
+
+    def __init__(
+        self,
+        k1: float = 1.5,
+        b: float = 0.75,
+        max_df_ratio: float = 0.5,
+        filter_fields: Tuple[str, ...] = ("doc_hash", "doc_key"),
+    ):
+        self.k1 = k1
+        self.b = b
+        # Query terms found in more than this share of chunks are skipped (near-zero IDF)
+        self.max_df_ratio = max_df_ratio
+        # Metadata fields with an equality index, so `where` filters narrow candidates before scoring
+        self.filter_fields = filter_fields
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._texts: Dict[str, str] = {}
+        self._metadatas: Dict[str, Dict[str, Any]] = {}
+        # (field, value) -> chunk IDs
+        self._by_field: Dict[Tuple[str, Hashable], Set[str]] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(
+        self,
+        ids: Iterable[str],
+        texts: Iterable[str],
+        metadatas: Optional[Iterable[Optional[Dict[str, Any]]]] = None,
+    ) -> None:
+        """Index chunks, replacing any chunk already stored under the same ID"""
+        ids = list(ids)
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+        with self._lock:
+            self.remove(chunk_id for chunk_id in ids if chunk_id in self._lengths)
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                term_counts = Counter(tokenize(text))
+                for term, count in term_counts.items():
+                    self._postings.setdefault(term, {})[chunk_id] = count
+                length = sum(term_counts.values())
+                self._lengths[chunk_id] = length
+                self._total_length += length
+                self._texts[chunk_id] = text
+                self._set_metadata(chunk_id, metadata)
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """Drop chunks from the index"""
+        with self._lock:
+            for chunk_id in list(ids):
+                text = self._texts.pop(chunk_id, None)
+                if text is None:
+                    continue
+                for term in set(tokenize(text)):
+                    postings = self._postings.get(term)
+                    if postings is not None:
+                        postings.pop(chunk_id, None)
+                        if not postings:
+                            del self._postings[term]
+                self._total_length -= self._lengths.pop(chunk_id)
+                self._unindex_metadata(chunk_id)
+                self._metadatas.pop(chunk_id, None)
+
+    def update_metadata(self, ids: Iterable[str], metadatas: Iterable[Dict[str, Any]]) -> None:
+        """Replace stored metadata without re-tokenizing"""
+        with self._lock:
+            for chunk_id, metadata in zip(ids, metadatas):
+                if chunk_id in self._metadatas:
+                    self._unindex_metadata(chunk_id)
+                    self._set_metadata(chunk_id, metadata)
+
+    def _set_metadata(self, chunk_id: str, metadata: Optional[Dict[str, Any]]) -> None:
+        metadata = dict(metadata or {})
+        self._metadatas[chunk_id] = metadata
+        for field in self.filter_fields:
+            value = metadata.get(field)
+            if value is not None:
+                self._by_field.setdefault((field, value), set()).add(chunk_id)
+
+    def _unindex_metadata(self, chunk_id: str) -> None:
+        metadata = self._metadatas.get(chunk_id, {})
+        for field in self.filter_fields:
+            key = (field, metadata.get(field))
+            chunk_ids = self._by_field.get(key)
+            if chunk_ids is not None:
+                chunk_ids.discard(chunk_id)
+                if not chunk_ids:
+                    del self._by_field[key]
+
+    def _candidates(self, where: Dict[str, Any]) -> Optional[Set[str]]:
+        """Chunk IDs matching the indexed fields of `where`, or None if none are indexed"""
+        candidates = None
+        for field, value in where.items():
+            if field not in self.filter_fields:
+                continue
+            chunk_ids = self._by_field.get((field, value), set())
+            candidates = chunk_ids if candidates is None else candidates & chunk_ids
+        return candidates
+
+    def search(
+        self, query: str, k: int = 20, where: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[str, float]]:
+        """Top-k (chunk ID, BM25 score) pairs, optionally filtered by metadata equality"""
+        with self._lock:
+            count = len(self._lengths)
+            if not count:
+                return []
+            candidates = None
+            unindexed_where = where
+            if where:
+                candidates = self._candidates(where)
+                if candidates is not None:
+                    if not candidates:
+                        return []
+                    unindexed_where = {
+                        key: value for key, value in where.items() if key not in self.filter_fields
+                    }
+
+            terms = [(term, self._postings[term]) for term in set(tokenize(query)) if term in self._postings]
+            # Terms present in most chunks barely change the ranking but dominate the
+            # cost; keep them only when nothing rarer matched
+            max_df = self.max_df_ratio * count
+            selective = [(term, postings) for term, postings in terms if len(postings) <= max_df]
+            if terms and not selective:
+                selective = [min(terms, key=lambda item: len(item[1]))]
+
+            avg_length = self._total_length / count
+            lengths = self._lengths
+            k1 = self.k1
+            base = k1 * (1 - self.b)
+            per_length = k1 * self.b / avg_length
+            scores: Dict[str, float] = {}
+            for term, postings in selective:
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                weight = idf * (k1 + 1)
+                # Walk whichever side is smaller: the filtered chunks or the posting list
+                if candidates is not None and len(candidates) < len(postings):
+                    matches = ((chunk_id, postings[chunk_id]) for chunk_id in candidates if chunk_id in postings)
+                elif candidates is not None:
+                    matches = ((chunk_id, tf) for chunk_id, tf in postings.items() if chunk_id in candidates)
+                else:
+                    matches = postings.items()
+                for chunk_id, tf in matches:
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + weight * tf / (
+                        tf + base + per_length * lengths[chunk_id]
+                    )
+            if unindexed_where:
+                scores = {
+                    chunk_id: score
+                    for chunk_id, score in scores.items()
+                    if all(self._metadatas[chunk_id].get(key) == value for key, value in unindexed_where.items())
+                }
+            return heapq.nlargest(k, scores.items(), key=itemgetter(1))
+
+    def get(self, chunk_id: str) -> Tuple[str, Dict[str, Any]]:
+        """Stored text and metadata of a chunk"""
+        with self._lock:
+            return self._texts[chunk_id], self._metadatas[chunk_id]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[str]:
+    """Fuse several ranked key lists: score(d) = sum over lists of 1 / (k + rank)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
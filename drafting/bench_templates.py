@@ -0,0 +1,98 @@
+"""
+Micro-benchmark of template rendering for the fallback path
+Compares the original str.format rendering (NDA address/exclusion fields
+hand-formatted before every call) with drafting.template_engine on the template
+packs, and checks that both produce identical documents.
+
+Usage: python -m drafting.bench_templates [--repeat N] [--documents N]
+"""
+
+import argparse
+import timeit
+
+from .registry import TemplateRegistry
+
+# The NDA template before conditional sections replaced the *_formatted fields
+LEGACY_NDA_SECTIONS = {
+    "{?disclosing_party_address} (Address: {disclosing_party_address}){/disclosing_party_address}":
+        "{disclosing_party_address_formatted}",
+    "{?receiving_party_address} (Address: {receiving_party_address}){/receiving_party_address}":
+        "{receiving_party_address_formatted}",
+    "{?specific_exclusions}Additional exclusions: {specific_exclusions}\n{/specific_exclusions}":
+        "{specific_exclusions_formatted}",
+}
+
+
+def legacy_template(document_type: str, source: str) -> str:
+    if document_type == "nda":
+        for section, field in LEGACY_NDA_SECTIONS.items():
+            source = source.replace(section, field)
+    return source
+
+
+def legacy_render(document_type: str, template: str, collected_info: dict) -> str:
+    """The original LegalDocumentAgent fallback: hand formatting, then str.format"""
+    collected_info = dict(collected_info)
+    if document_type == "nda":
+        disclosing_addr = collected_info.get("disclosing_party_address", "")
+        receiving_addr = collected_info.get("receiving_party_address", "")
+        collected_info["disclosing_party_address_formatted"] = (
+            f" (Address: {disclosing_addr})" if disclosing_addr else ""
+        )
+        collected_info["receiving_party_address_formatted"] = (
+            f" (Address: {receiving_addr})" if receiving_addr else ""
+        )
+        exclusions = collected_info.get("specific_exclusions", "")
+        if exclusions:
+            collected_info["specific_exclusions_formatted"] = (
+                f"Additional exclusions: {exclusions}\n"
+            )
+        else:
+            collected_info["specific_exclusions_formatted"] = ""
+    return template.format(**collected_info)
+
+
+def make_rows(registry: TemplateRegistry, document_type: str, count: int) -> list:
+    """Answers for every question; every third row leaves the optional ones empty"""
+    questions = registry.questions(document_type)
+    rows = []
+    for i in range(count):
+        row = {"date": "January 01, 2025"}
+        for field, config in questions.items():
+            skip = i % 3 == 0 and not config.get("required", False)
+            row[field] = "" if skip else f"{field.replace('_', ' ').title()} {i}"
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions (best is reported)")
+    parser.add_argument("--documents", type=int, default=2000, help="documents per document type and run")
+    args = parser.parse_args()
+
+    registry = TemplateRegistry()
+    for document_type in registry.document_types():
+        template = registry.template(document_type)
+        legacy = legacy_template(document_type, template.source)
+        rows = make_rows(registry, document_type, args.documents)
+
+        expected = [legacy_render(document_type, legacy, row) for row in rows]
+        assert [template.render(row) for row in rows] == expected, f"{document_type}: render differs"
+        assert template.render_many(rows) == expected, f"{document_type}: render_many differs"
+
+        runs = {
+            "legacy str.format": lambda: [legacy_render(document_type, legacy, row) for row in rows],
+            "render": lambda: [template.render(row) for row in rows],
+            "render_many (batch)": lambda: template.render_many(rows),
+        }
+        print(f"{document_type}: {len(rows)} documents, {len(template.source):,} char template, best of {args.repeat}")
+        baseline = None
+        for name, run in runs.items():
+            best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+            baseline = baseline or best
+            print(f"  {name:<22} {best * 1000:8.2f} ms  {len(rows) / best:10,.0f} docs/s  {baseline / best:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
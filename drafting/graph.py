@@ -2,30 +2,37 @@
 Conversational Legal Document Drafting Agent using LangGraph
 """
 
-import os
-from typing import Dict, Any, List
+import asyncio
+import logging
+import sqlite3
+from typing import Dict, Any, AsyncIterator, Callable, Iterator, List
 from datetime import datetime
 from langgraph.graph import StateGraph, END
-from openai import OpenAI
+from langgraph.checkpoint.sqlite import SqliteSaver
+from typing_extensions import TypedDict
 
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 
+from llm_gateway.gateway import get_gateway
 from .memory import SessionMemoryManager
 from .prompt_templates import (
     DOCUMENT_IDENTIFICATION_PROMPT,
     QUESTION_GENERATION_PROMPT,
     DOCUMENT_GENERATION_PROMPT,
     get_questions_for_document,
-    get_template_for_document,
+    get_compiled_template,
     get_missing_required_fields,
     format_collected_info_for_display,
+    match_document_type,
 )
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 class AgentState(BaseModel):
     session_id: str = Field(description="Session identifier")
@@ -37,6 +44,9 @@ class AgentState(BaseModel):
     current_question: str = Field(
         default="", description="Current question being asked"
     )
+    pending_field: str = Field(
+        default="", description="Field the current question collects"
+    )
     conversation_history: List[Dict[str, str]] = Field(
         default_factory=list, description="Conversation history"
     )
@@ -47,58 +57,156 @@ class AgentState(BaseModel):
     error_message: str = Field(default="", description="Error message if any")
 
 
+class DraftingState(TypedDict, total=False):
+    """Graph state of a drafting session, checkpointed between turns."""
+
+    session_id: str
+    user_input: str
+    document_type: str
+    collected_info: Dict[str, Any]
+    current_question: str
+    pending_field: str
+    conversation_history: List[Dict[str, str]]
+    is_complete: bool
+    final_document: str
+    error_message: str
+
+
+class SessionCheckpointer(SqliteSaver):
+    """SqliteSaver that also serves the async graph API by running its sync
+    methods in a worker thread, so invoke() and ainvoke() share one store."""
+
+    @classmethod
+    def open(cls, db_path: str) -> "SessionCheckpointer":
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        checkpointer = cls(conn)
+        checkpointer.setup()
+        return checkpointer
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        checkpoints = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
 class LegalDocumentAgent:
     def __init__(self):
         self.setup_llm()
         self.memory_manager = SessionMemoryManager()
+        # Turn state survives restarts and is shared by workers on the same storage
+        self.checkpointer = SessionCheckpointer.open(str(self.memory_manager.db_path))
         self.graph = self.create_graph()
 
     def setup_llm(self):
-        api_key = os.getenv("OPENROUTER_API_KEY")
-        if not api_key:
-            raise ValueError("OPENROUTER_API_KEY not found in environment variables.")
-        self.llm_client = OpenAI(
-            api_key=api_key,
-            base_url="https://openrouter.ai/api/v1",
-            default_headers={
-                "HTTP-Referer": "http://localhost:8501",
-                "X-Title": "Agentic Legal AI",
-            },
-        )
+        # Pooling, rate limits, retries and failover live in the shared gateway
+        self.gateway = get_gateway()
+        if not self.gateway.available_providers():
+            raise ValueError(
+                "No LLM provider configured; set OPENROUTER_API_KEY, GROQ_API_KEY or GEMINI_API_KEY."
+            )
         self.model = "deepseek/deepseek-chat-v3-0324:free"
 
+    def _llm_request(self, prompt: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        prompt_text = ChatPromptTemplate.from_template(prompt).format(**input_data)
+        return {
+            "prompt": prompt_text,
+            "models": {"openrouter": self.model},
+            "temperature": 0.3,
+            "max_tokens": 2048,
+        }
+
     def get_llm_response(self, prompt: str, input_data: Dict[str, Any]) -> str:
-        formatted_prompt = ChatPromptTemplate.from_template(prompt)
-        parser = StrOutputParser()
         try:
-            prompt_text = formatted_prompt.format(**input_data)
-            response = self.llm_client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt_text}],
-                temperature=0.3,
-                max_tokens=2048,
-            )
-            return response.choices[0].message.content.strip()
+            return self.gateway.complete(**self._llm_request(prompt, input_data)).content
         except Exception as e:
             return f"Error: LLM call failed: {e}"
 
+    async def aget_llm_response(self, prompt: str, input_data: Dict[str, Any]) -> str:
+        """Async counterpart of get_llm_response."""
+        try:
+            completion = await self.gateway.acomplete(**self._llm_request(prompt, input_data))
+            return completion.content
+        except Exception as e:
+            return f"Error: LLM call failed: {e}"
+
+    def stream_llm_response(self, prompt: str, input_data: Dict[str, Any]) -> Iterator[str]:
+        """Yield completion tokens as the provider streams them."""
+        yield from self.gateway.stream(**self._llm_request(prompt, input_data))
+
+    async def astream_llm_response(
+        self, prompt: str, input_data: Dict[str, Any]
+    ) -> AsyncIterator[str]:
+        """Async counterpart of stream_llm_response."""
+        tokens = self.gateway.astream(**self._llm_request(prompt, input_data))
+        try:
+            async for token in tokens:
+                yield token
+        finally:
+            # Frees the provider's concurrency permit even if our consumer stops early
+            await tokens.aclose()
+
+    def _guarded(self, node: Callable) -> Callable:
+        """Node wrapper that records a failure in error_message, routing the turn to handle_error."""
+
+        def run(state: Dict[str, Any]) -> Dict[str, Any]:
+            try:
+                return node(state)
+            except Exception as e:
+                logger.error(f"Drafting node {node.__name__} failed: {e}")
+                return {"error_message": f"Error in {node.__name__}: {e}"}
+
+        return run
+
+    def _aguarded(self, node: Callable) -> Callable:
+        """Async counterpart of _guarded."""
+
+        async def run(state: Dict[str, Any]) -> Dict[str, Any]:
+            try:
+                return await node(state)
+            except Exception as e:
+                logger.error(f"Drafting node {node.__name__} failed: {e}")
+                return {"error_message": f"Error in {node.__name__}: {e}"}
+
+        return run
+
     def create_graph(self) -> StateGraph:
-        workflow = StateGraph(AgentState)
-        workflow.add_node("identify_document", self.identify_document_type)
-        workflow.add_node("ask_question", self.ask_question)
-        workflow.add_node("process_answer", self.process_answer)
-        workflow.add_node("generate_document", self.generate_document)
+        """One invocation per user turn; state persists per session in the checkpointer."""
+        workflow = StateGraph(DraftingState)
+        workflow.add_node("identify_document", self._guarded(self.start_document))
+        workflow.add_node("ask_question", self._guarded(self.ask_question))
+        workflow.add_node("process_answer", self._guarded(self.process_answer))
+        # Sync and async implementations, so both invoke() and ainvoke() work
+        workflow.add_node(
+            "generate_document",
+            RunnableLambda(
+                self._guarded(self.generate_document),
+                afunc=self._aguarded(self.agenerate_document),
+            ),
+        )
         workflow.add_node("handle_error", self.handle_error)
-        workflow.set_entry_point("identify_document")
+        workflow.set_conditional_entry_point(
+            self.route_turn,
+            {"identify_document": "identify_document", "process_answer": "process_answer"},
+        )
         workflow.add_conditional_edges(
             "identify_document",
             self.should_continue_after_identification,
-            {"ask_question": "ask_question", "error": "handle_error"},
-        )
-        workflow.add_conditional_edges(
-            "ask_question",
-            self.should_continue_after_asking,
-            {"process_answer": "process_answer", "error": "handle_error"},
+            {"ask_question": "ask_question", "end": END, "error": "handle_error"},
         )
         workflow.add_conditional_edges(
             "process_answer",
@@ -109,38 +217,117 @@ class LegalDocumentAgent:
                 "error": "handle_error",
             },
         )
-        workflow.add_edge("generate_document", END)
+        # Asking a question ends the turn; the answer arrives with the next one
+        workflow.add_conditional_edges(
+            "ask_question",
+            self.should_continue_after_asking,
+            {"generate_document": "generate_document", "end": END, "error": "handle_error"},
+        )
+        workflow.add_conditional_edges(
+            "generate_document",
+            self.should_continue_after_generation,
+            {"end": END, "error": "handle_error"},
+        )
         workflow.add_edge("handle_error", END)
-        return workflow.compile()
+        return workflow.compile(checkpointer=self.checkpointer)
+
+    def _turn_config(self, session_id: str) -> Dict[str, Any]:
+        return {"configurable": {"thread_id": str(session_id)}}
+
+    def _turn_input(self, session_id: str, user_input: str) -> Dict[str, Any]:
+        # A failure of the previous turn does not carry over
+        return {"session_id": str(session_id), "user_input": user_input, "error_message": ""}
+
+    @staticmethod
+    def turn_reply(state: Dict[str, Any]) -> str:
+        """Text to send back for a turn: the document once complete, else the next question."""
+        if state.get("is_complete"):
+            return state.get("final_document") or state.get("error_message", "")
+        return state.get("error_message") or state.get("current_question", "")
+
+    def run_turn(self, session_id: str, user_input: str) -> Dict[str, Any]:
+        """Advance a session by one user message; only the final turn calls the LLM."""
+        state = self.graph.invoke(
+            self._turn_input(session_id, user_input), self._turn_config(session_id)
+        )
+        if state.get("is_complete"):
+            # The document is done; drop its checkpoints so the next turn starts a new one
+            self.checkpointer.delete_thread(str(session_id))
+        return state
+
+    async def arun_turn(self, session_id: str, user_input: str) -> Dict[str, Any]:
+        """Async counterpart of run_turn."""
+        state = await self.graph.ainvoke(
+            self._turn_input(session_id, user_input), self._turn_config(session_id)
+        )
+        if state.get("is_complete"):
+            await self.checkpointer.adelete_thread(str(session_id))
+        return state
+
+    async def astream_turn(self, session_id: str, user_input: str) -> AsyncIterator[str]:
+        """Like arun_turn, but the document of the final turn is streamed token by token."""
+        config = self._turn_config(session_id)
+        state = await self.graph.ainvoke(
+            self._turn_input(session_id, user_input),
+            config,
+            interrupt_before=["generate_document"],
+        )
+        snapshot = await self.graph.aget_state(config)
+        if "generate_document" not in snapshot.next:
+            if state.get("is_complete"):
+                await self.checkpointer.adelete_thread(str(session_id))
+            yield self.turn_reply(state)
+            return
+        state = dict(snapshot.values)
+        streamed = False
+        try:
+            async for token in self.astream_document(state):
+                streamed = streamed or bool(token)
+                yield token
+        except Exception as e:
+            logger.error(f"Drafting node generate_document failed: {e}")
+            state["error_message"] = f"Error in generate_document: {e}"
+        if not streamed and not state.get("error_message"):
+            state["error_message"] = "Error in generate_document: no document was generated"
+        if state.get("error_message"):
+            # Record the failure as the generation step and finish the turn through
+            # handle_error; the collected answers stay, so the next message retries
+            await self.graph.aupdate_state(
+                config, {"error_message": state["error_message"]}, as_node="generate_document"
+            )
+            state = await self.graph.ainvoke(None, config)
+            if not streamed:
+                yield self.turn_reply(state)
+            return
+        # The document is done; the next turn starts a new one
+        await self.checkpointer.adelete_thread(str(session_id))
+
+    def route_turn(self, state: Dict[str, Any]) -> str:
+        """Entry routing: a new or finished session starts over, otherwise the input answers the pending question."""
+        if state.get("is_complete") or not state.get("document_type"):
+            return "identify_document"
+        return "process_answer"
+
+    def start_document(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        if state.get("is_complete"):
+            # Previous document is done; this turn starts a new one
+            state.update(
+                document_type="",
+                collected_info={},
+                current_question="",
+                pending_field="",
+                is_complete=False,
+                final_document="",
+                error_message="",
+            )
+        return self.identify_document_type(state)
 
     def identify_document_type(self, state: Dict[str, Any]) -> Dict[str, Any]:
         user_input = state.get("user_input", "").lower().strip()
         if state.get("document_type"):
             return state
-        # Canonical mapping for document types and aliases
-        type_map = {
-            "nda": "nda",
-            "non-disclosure agreement": "nda",
-            "contract": "contract",
-            "service agreement": "contract",
-            "employment contract": "contract",
-            "employment agreement": "contract",
-            "lease": "lease",
-            "lease agreement": "lease",
-            "rental agreement": "lease",
-            "residential lease agreement": "lease",
-        }
-        canonical_type = None
-        for k, v in type_map.items():
-            if k in user_input:
-                canonical_type = v
-                break
-        if not canonical_type:
-            # Try to match by partial words (e.g., 'lease', 'nda', 'contract')
-            for k, v in type_map.items():
-                if any(word in user_input for word in k.split()):
-                    canonical_type = v
-                    break
+        # Compiled alias matcher, built once from the template pack index
+        canonical_type = match_document_type(user_input)
         if not canonical_type:
             state["current_question"] = (
                 "Could you please specify the type of document you want to create? "
@@ -158,8 +345,11 @@ class LegalDocumentAgent:
         missing_fields = [f for f in questions if f not in collected_info]
         if not missing_fields:
             state["is_complete"] = True
+            state["pending_field"] = ""
             return state
         next_field = missing_fields[0]
+        # The next answer is recorded under this field
+        state["pending_field"] = next_field
         question_config = questions[next_field]
         base_question = question_config["question"]
         if question_config.get("examples"):
@@ -177,12 +367,12 @@ class LegalDocumentAgent:
         current_question = state.get("current_question", "")
         user_input = state.get("user_input", "")
         questions = get_questions_for_document(document_type)
-        for field, config in questions.items():
-            if config["question"] in current_question:
-                collected_info[field] = user_input
-                break
+        pending_field = state.get("pending_field", "")
+        if pending_field:
+            collected_info[pending_field] = user_input
+        state["pending_field"] = ""
         state["collected_info"] = collected_info
-        state["conversation_history"].append(
+        state.setdefault("conversation_history", []).append(
             {"question": current_question, "answer": user_input}
         )
         # Only complete when all questions (required and optional) are answered
@@ -191,38 +381,40 @@ class LegalDocumentAgent:
             state["is_complete"] = True
         return state
 
-    def generate_document(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    def _prepare_generation(self, state: Dict[str, Any]) -> Dict[str, Any]:
         document_type = state.get("document_type", "")
-        collected_info = state.get("collected_info", {})
-        template = get_template_for_document(document_type)
+        collected_info = state.setdefault("collected_info", {})
         today = datetime.now().strftime("%B %d, %Y")
         collected_info["date"] = today
 
-        # NDA-specific formatting for fallback
-        if document_type == "nda":
-            disclosing_addr = collected_info.get("disclosing_party_address", "")
-            receiving_addr = collected_info.get("receiving_party_address", "")
-            collected_info["disclosing_party_address_formatted"] = (
-                f" (Address: {disclosing_addr})" if disclosing_addr else ""
-            )
-            collected_info["receiving_party_address_formatted"] = (
-                f" (Address: {receiving_addr})" if receiving_addr else ""
-            )
-            exclusions = collected_info.get("specific_exclusions", "")
-            if exclusions:
-                collected_info["specific_exclusions_formatted"] = (
-                    f"Additional exclusions: {exclusions}\n"
-                )
-            else:
-                collected_info["specific_exclusions_formatted"] = ""
-
-        # Try LLM-based document generation first
-        llm_input = {
+        return {
             "document_type": document_type,
             "collected_info": format_collected_info_for_display(collected_info),
             "date": today,
         }
+
+    def _render_template(self, state: Dict[str, Any]) -> str:
+        collected_info = state.get("collected_info", {})
+        document_type = state.get("document_type", "")
+        # Compiled once per pack; optional fields and sections are handled by the template
+        template = get_compiled_template(document_type, collected_info.get("jurisdiction"))
+        if template is None:
+            raise ValueError(f"No template for document type '{document_type}'")
+        return template.render(collected_info)
+
+    def generate_document(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        # Try LLM-based document generation first
+        llm_input = self._prepare_generation(state)
         llm_result = self.get_llm_response(DOCUMENT_GENERATION_PROMPT, llm_input)
+        return self._finish_generation(state, llm_result)
+
+    async def agenerate_document(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Async counterpart of generate_document."""
+        llm_input = self._prepare_generation(state)
+        llm_result = await self.aget_llm_response(DOCUMENT_GENERATION_PROMPT, llm_input)
+        return self._finish_generation(state, llm_result)
+
+    def _finish_generation(self, state: Dict[str, Any], llm_result: str) -> Dict[str, Any]:
         if llm_result and not llm_result.lower().startswith("error"):
             state["final_document"] = (
                 llm_result + "\n\n[Generated by LLM (Groq or Gemini)]"
@@ -232,7 +424,7 @@ class LegalDocumentAgent:
 
         # Fallback: use template formatting
         try:
-            document = template.format(**collected_info)
+            document = self._render_template(state)
         except Exception as e:
             state["error_message"] = f"Error generating document: {e}"
             return state
@@ -240,19 +432,83 @@ class LegalDocumentAgent:
         state["is_complete"] = True
         return state
 
+    def stream_document(self, state: Dict[str, Any]) -> Iterator[str]:
+        """Streaming counterpart of generate_document: yields the document as it is written."""
+        llm_input = self._prepare_generation(state)
+        streamed = False
+        try:
+            for token in self.stream_llm_response(DOCUMENT_GENERATION_PROMPT, llm_input):
+                streamed = True
+                yield token
+        except Exception as e:
+            if streamed:
+                state["error_message"] = f"Generation interrupted: {e}"
+                yield f"\n\n[Generation interrupted: {e}]"
+                return
+        if streamed:
+            yield "\n\n[Generated by LLM (Groq or Gemini)]"
+            return
+
+        # Fallback: use template formatting
+        yield self._render_fallback(state)
+
+    async def astream_document(self, state: Dict[str, Any]) -> AsyncIterator[str]:
+        """Async counterpart of stream_document."""
+        llm_input = self._prepare_generation(state)
+        streamed = False
+        try:
+            async for token in self.astream_llm_response(DOCUMENT_GENERATION_PROMPT, llm_input):
+                streamed = True
+                yield token
+        except Exception as e:
+            if streamed:
+                state["error_message"] = f"Generation interrupted: {e}"
+                yield f"\n\n[Generation interrupted: {e}]"
+                return
+        if streamed:
+            yield "\n\n[Generated by LLM (Groq or Gemini)]"
+            return
+
+        # Fallback: use template formatting
+        yield self._render_fallback(state)
+
+    def _render_fallback(self, state: Dict[str, Any]) -> str:
+        try:
+            return self._render_template(state) + "\n\n[Generated by predefined template]"
+        except Exception as e:
+            state["error_message"] = f"Error generating document: {e}"
+            return state["error_message"]
+
     def handle_error(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        state["error_message"] = state.get("error_message", "Unknown error.")
+        """Ends a failed turn; the session stays where it was and the next turn retries."""
+        state["error_message"] = state.get("error_message") or "Unknown error."
+        state["is_complete"] = False
         return state
 
     def should_continue_after_identification(self, state: Dict[str, Any]) -> str:
+        if state.get("error_message"):
+            return "error"
         if state.get("document_type"):
             return "ask_question"
-        return "error"
+        # Could not tell the document type; the clarifying question ends the turn
+        return "end"
 
     def should_continue_after_asking(self, state: Dict[str, Any]) -> str:
-        return "process_answer"
+        if state.get("error_message"):
+            return "error"
+        if state.get("is_complete"):
+            return "generate_document"
+        return "end"
 
     def should_continue_after_processing(self, state: Dict[str, Any]) -> str:
+        if state.get("error_message"):
+            return "error"
         if state.get("is_complete"):
             return "generate_document"
         return "ask_question"
+
+    def should_continue_after_generation(self, state: Dict[str, Any]) -> str:
+        # The template fallback failed too
+        if state.get("error_message"):
+            return "error"
+        return "end"
@@ -4,15 +4,470 @@ Session Memory Management for Conversational Legal Document Drafting Agent
 
 import json
 import os
-from typing import Dict, Any, Optional
+import copy
+import atexit
+import logging
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(ABC):
+    """Storage backend for drafting sessions and their messages."""
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Session data including conversation_history, or None if missing."""
+
+    @abstractmethod
+    def exists(self, session_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def save(self, session_id: str, session_data: Dict[str, Any]) -> None:
+        """Create or replace a session's fields; conversation_history is left as stored."""
+
+    @abstractmethod
+    def append_message(self, session_id: str, message: Dict[str, Any], last_updated: str) -> None:
+        """Append one message to a session's conversation_history."""
+
+    @abstractmethod
+    def replace_history(self, session_id: str, messages: List[Dict[str, Any]], last_updated: str) -> None:
+        """Replace a session's conversation_history; the only way messages are removed."""
+
+    def apply_changes(
+        self,
+        session_id: str,
+        session_data: Optional[Dict[str, Any]],
+        history: Optional[List[Dict[str, Any]]],
+        new_messages: List[Dict[str, Any]],
+        last_updated: str,
+    ) -> None:
+        """Write a batch of pending changes: new fields (if any), a replaced history
+        (if any), then appended messages. Stores override this to write once."""
+        if session_data is not None:
+            self.save(session_id, session_data)
+        if history is not None:
+            self.replace_history(session_id, history, last_updated)
+        for message in new_messages:
+            self.append_message(session_id, message, last_updated)
+
+    @abstractmethod
+    def messages(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Messages of one session, or of all sessions."""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def list_ids(self) -> List[str]:
+        ...
+
+
+class JSONFileSessionStore(SessionStore):
+    """One JSON file per session, replaced atomically on every save."""
+
+    def __init__(self, storage_dir: str):
+        self.storage_dir = Path(storage_dir)
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_session_file_path(self, session_id: str) -> Path:
+        return self.storage_dir / f"session_{session_id}.json"
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.get_session_file_path(session_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def exists(self, session_id: str) -> bool:
+        return self.get_session_file_path(session_id).exists()
+
+    def _write(self, session_id: str, session_data: Dict[str, Any]) -> None:
+        # Write a temp file in the same directory, then rename over the old file,
+        # so readers never see a partially written session
+        fd, tmp_path = tempfile.mkstemp(dir=self.storage_dir, prefix=f".session_{session_id}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(session_data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.get_session_file_path(session_id))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def save(self, session_id: str, session_data: Dict[str, Any]) -> None:
+        stored = self.load(session_id) or {}
+        session_data = dict(session_data, conversation_history=stored.get("conversation_history", []))
+        self._write(session_id, session_data)
+
+    def append_message(self, session_id: str, message: Dict[str, Any], last_updated: str) -> None:
+        session_data = self.load(session_id) or {"session_id": session_id}
+        session_data.setdefault("conversation_history", []).append(message)
+        session_data["last_updated"] = last_updated
+        self._write(session_id, session_data)
+
+    def replace_history(self, session_id: str, messages: List[Dict[str, Any]], last_updated: str) -> None:
+        session_data = self.load(session_id) or {"session_id": session_id}
+        session_data["conversation_history"] = list(messages)
+        session_data["last_updated"] = last_updated
+        self._write(session_id, session_data)
+
+    def apply_changes(
+        self,
+        session_id: str,
+        session_data: Optional[Dict[str, Any]],
+        history: Optional[List[Dict[str, Any]]],
+        new_messages: List[Dict[str, Any]],
+        last_updated: str,
+    ) -> None:
+        # One read and one file rewrite for the whole batch
+        stored = self.load(session_id) or {"session_id": session_id}
+        if history is None:
+            history = stored.get("conversation_history", [])
+        if session_data is not None:
+            stored = dict(session_data)
+        stored["conversation_history"] = list(history) + list(new_messages)
+        stored["last_updated"] = last_updated
+        self._write(session_id, stored)
+
+    def messages(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        session_ids = [session_id] if session_id else self.list_ids()
+        all_msgs = []
+        for sid in session_ids:
+            session_data = self.load(sid) or {}
+            all_msgs.extend(session_data.get("conversation_history", []))
+        return all_msgs
+
+    def delete(self, session_id: str) -> bool:
+        session_file = self.get_session_file_path(session_id)
+        if session_file.exists():
+            os.remove(session_file)
+            return True
+        return False
+
+    def list_ids(self) -> List[str]:
+        session_files = list(self.storage_dir.glob("session_*.json"))
+        return [f.stem.replace("session_", "") for f in session_files]
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite (WAL) store: indexed session lookups and append-only message rows."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, last_updated TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id)"
+        )
+        self._conn.commit()
+
+    def is_empty(self) -> bool:
+        return self._conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone() is None
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            session_data = json.loads(row[0])
+            session_data["conversation_history"] = self._messages(session_id)
+        return session_data
+
+    def _messages(self, session_id: Optional[str]) -> List[Dict[str, Any]]:
+        if session_id:
+            rows = self._conn.execute(
+                "SELECT data FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+            )
+        else:
+            rows = self._conn.execute("SELECT data FROM messages ORDER BY id")
+        return [json.loads(data) for (data,) in rows]
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone() is not None
+
+    def save(self, session_id: str, session_data: Dict[str, Any]) -> None:
+        # Message rows are never touched here, so a stale copy of the session
+        # cannot drop messages appended by another writer
+        self.apply_changes(session_id, session_data, None, [], session_data.get("last_updated", ""))
+
+    def append_message(self, session_id: str, message: Dict[str, Any], last_updated: str) -> None:
+        self.apply_changes(session_id, None, None, [message], last_updated)
+
+    def replace_history(self, session_id: str, messages: List[Dict[str, Any]], last_updated: str) -> None:
+        self.apply_changes(session_id, None, messages, [], last_updated)
+
+    def apply_changes(
+        self,
+        session_id: str,
+        session_data: Optional[Dict[str, Any]],
+        history: Optional[List[Dict[str, Any]]],
+        new_messages: List[Dict[str, Any]],
+        last_updated: str,
+    ) -> None:
+        # One transaction (and one commit) for the whole batch
+        with self._lock:
+            try:
+                if session_data is not None:
+                    data = {k: v for k, v in session_data.items() if k != "conversation_history"}
+                    self._conn.execute(
+                        "INSERT INTO sessions (session_id, data, last_updated) VALUES (?, ?, ?) "
+                        "ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, last_updated = excluded.last_updated",
+                        (session_id, json.dumps(data, ensure_ascii=False), data.get("last_updated", "")),
+                    )
+                messages = list(new_messages)
+                if history is not None:
+                    self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                    messages = list(history) + messages
+                if messages:
+                    self._conn.executemany(
+                        "INSERT INTO messages (session_id, data) VALUES (?, ?)",
+                        [(session_id, json.dumps(m, ensure_ascii=False)) for m in messages],
+                    )
+                if history is not None or messages:
+                    self._conn.execute(
+                        "UPDATE sessions SET last_updated = ?, "
+                        "data = json_set(data, '$.last_updated', ?) WHERE session_id = ?",
+                        (last_updated, last_updated, session_id),
+                    )
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def messages(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self._messages(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+            ).rowcount
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+        return bool(deleted)
+
+    def list_ids(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT session_id FROM sessions ORDER BY rowid")
+            return [session_id for (session_id,) in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SessionLocks:
+    """Per-session reentrant locks, created on first use."""
+
+    def __init__(self):
+        self._locks: Dict[str, threading.RLock] = {}
+        self._guard = threading.Lock()
+
+    def get(self, session_id: str) -> threading.RLock:
+        with self._guard:
+            return self._locks.setdefault(session_id, threading.RLock())
+
+
+class WriteBackSessionStore(SessionStore):
+    """In-memory write-back layer over another store.
+
+    Saves and appended messages are held per session and coalesced; dirty
+    sessions are flushed to the backing store once flush_interval seconds
+    after the first pending write, on flush()/close(), and at interpreter exit.
+    Messages reach the backend only through append_message/replace_history,
+    never as part of a save.
+    """
+
+    def __init__(
+        self, backend: SessionStore, flush_interval: float = 1.0, locks: Optional[SessionLocks] = None
+    ):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        # Current view of each dirty session, history included
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # What the backend is missing: {"save": bool, "replace": bool, "messages": [...]}
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._locks = locks or SessionLocks()
+        self._timer: Optional[threading.Timer] = None
+        self._timer_guard = threading.Lock()
+        atexit.register(self.flush)
+
+    def lock(self, session_id: str) -> threading.RLock:
+        """Per-session lock; hold it across a read-modify-write of one session."""
+        return self._locks.get(session_id)
+
+    def _schedule_flush(self) -> None:
+        with self._timer_guard:
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _timed_flush(self) -> None:
+        with self._timer_guard:
+            self._timer = None
+        self.flush()
+
+    def _view(self, session_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Pending view and dirty record of a session; call with its lock held."""
+        if session_id not in self._pending:
+            self._pending[session_id] = self.backend.load(session_id) or {
+                "session_id": session_id,
+                "conversation_history": [],
+            }
+            self._dirty[session_id] = {"save": False, "replace": False, "messages": []}
+        return self._pending[session_id], self._dirty[session_id]
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock(session_id):
+            if session_id in self._pending:
+                return copy.deepcopy(self._pending[session_id])
+            return self.backend.load(session_id)
+
+    def exists(self, session_id: str) -> bool:
+        return session_id in self._pending or self.backend.exists(session_id)
+
+    def save(self, session_id: str, session_data: Dict[str, Any]) -> None:
+        with self.lock(session_id):
+            view, dirty = self._view(session_id)
+            history = view.get("conversation_history", [])
+            view.clear()
+            view.update(copy.deepcopy({k: v for k, v in session_data.items() if k != "conversation_history"}))
+            view["conversation_history"] = history
+            dirty["save"] = True
+        self._schedule_flush()
+
+    def append_message(self, session_id: str, message: Dict[str, Any], last_updated: str) -> None:
+        with self.lock(session_id):
+            view, dirty = self._view(session_id)
+            message = copy.deepcopy(message)
+            view.setdefault("conversation_history", []).append(message)
+            view["last_updated"] = last_updated
+            dirty["messages"].append(message)
+        self._schedule_flush()
+
+    def replace_history(self, session_id: str, messages: List[Dict[str, Any]], last_updated: str) -> None:
+        with self.lock(session_id):
+            view, dirty = self._view(session_id)
+            view["conversation_history"] = copy.deepcopy(list(messages))
+            view["last_updated"] = last_updated
+            # Earlier pending appends are part of the replaced history
+            dirty["replace"] = True
+            dirty["messages"] = []
+        self._schedule_flush()
+
+    def messages(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        if session_id:
+            with self.lock(session_id):
+                if session_id in self._pending:
+                    return copy.deepcopy(self._pending[session_id].get("conversation_history", []))
+                return self.backend.messages(session_id)
+        self.flush()
+        return self.backend.messages()
+
+    def delete(self, session_id: str) -> bool:
+        with self.lock(session_id):
+            pending = self._pending.pop(session_id, None) is not None
+            self._dirty.pop(session_id, None)
+            return self.backend.delete(session_id) or pending
+
+    def list_ids(self) -> List[str]:
+        session_ids = self.backend.list_ids()
+        known = set(session_ids)
+        return session_ids + [sid for sid in list(self._pending) if sid not in known]
+
+    def _flush_session(self, session_id: str) -> None:
+        view, dirty = self._pending[session_id], self._dirty[session_id]
+        # Everything pending for the session goes to the backend as one batch:
+        # one file rewrite for JSON, one transaction for SQLite
+        self.backend.apply_changes(
+            session_id,
+            view if dirty["save"] else None,
+            view.get("conversation_history", []) if dirty["replace"] else None,
+            [] if dirty["replace"] else dirty["messages"],
+            view.get("last_updated", ""),
+        )
+
+    def flush(self) -> None:
+        """Write every dirty session to the backing store."""
+        for session_id in list(self._pending):
+            with self.lock(session_id):
+                if session_id not in self._pending:
+                    continue
+                try:
+                    self._flush_session(session_id)
+                except Exception as e:
+                    # Kept pending; retried on the next flush
+                    logger.error(f"Failed to flush drafting session {session_id}: {e}")
+                    self._schedule_flush()
+                    continue
+                del self._pending[session_id]
+                del self._dirty[session_id]
+
+    def close(self) -> None:
+        with self._timer_guard:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self.flush()
+
+
+# Stores and session locks shared by every manager on the same storage, so
+# their write-back caches and session locks are one and the same
+_stores: Dict[Tuple[str, str], SessionStore] = {}
+_session_locks: Dict[Tuple[str, str], SessionLocks] = {}
+_stores_lock = threading.Lock()
+
+
 class SessionMemoryManager:
     """Manages session-based memory for the legal document drafting agent."""
-    def __init__(self, storage_dir: str = "Experiments/session_data"):
+    def __init__(
+        self,
+        storage_dir: str = "Experiments/session_data",
+        backend: Optional[str] = None,
+        flush_interval: Optional[float] = None,
+    ):
         self.storage_dir = Path(storage_dir)
         self.storage_dir.mkdir(parents=True, exist_ok=True)
+        # SQLite database of the sqlite backend; the drafting graph keeps its checkpoints here too
+        self.db_path = self.storage_dir / "sessions.sqlite3"
+        self.backend = backend or os.getenv("DRAFTING_SESSION_STORE", "sqlite")
+        # Seconds dirty sessions stay in memory before being flushed; 0 writes through
+        if flush_interval is None:
+            flush_interval = float(os.getenv("DRAFTING_SESSION_FLUSH_INTERVAL", "1.0"))
+        self.flush_interval = flush_interval
+        with _stores_lock:
+            key = (self.backend, str(self.storage_dir.resolve()))
+            if key not in _stores:
+                _session_locks[key] = SessionLocks()
+                _stores[key] = self._create_store(_session_locks[key])
+            self.store = _stores[key]
+            self._locks = _session_locks[key]
         self.default_session = {
             "session_id": "",
             "created_at": "",
@@ -25,11 +480,42 @@ class SessionMemoryManager:
             "final_document": ""
         }
 
-    def get_session_file_path(self, session_id: str) -> Path:
-        return self.storage_dir / f"session_{session_id}.json"
+    def _create_backend_store(self) -> SessionStore:
+        if self.backend == "json":
+            return JSONFileSessionStore(str(self.storage_dir))
+        if self.backend != "sqlite":
+            raise ValueError(f"Unknown session store backend: {self.backend}")
+        store = SQLiteSessionStore(str(self.db_path))
+        if store.is_empty():
+            # One-off import of sessions written by the JSON file backend
+            json_store = JSONFileSessionStore(str(self.storage_dir))
+            for session_id in json_store.list_ids():
+                session_data = json_store.load(session_id)
+                if session_data is not None:
+                    store.save(session_id, session_data)
+                    store.replace_history(
+                        session_id,
+                        session_data.get("conversation_history", []),
+                        session_data.get("last_updated", ""),
+                    )
+        return store
+
+    def _create_store(self, locks: SessionLocks) -> SessionStore:
+        store = self._create_backend_store()
+        if self.flush_interval > 0:
+            store = WriteBackSessionStore(store, self.flush_interval, locks)
+        return store
+
+    def session_lock(self, session_id: str) -> threading.RLock:
+        """Per-session lock for read-modify-write sequences, with or without write-back."""
+        return self._locks.get(session_id)
+
+    def flush(self) -> None:
+        if isinstance(self.store, WriteBackSessionStore):
+            self.store.flush()
 
     def create_session(self, session_id: str) -> Dict[str, Any]:
-        session_data = self.default_session.copy()
+        session_data = json.loads(json.dumps(self.default_session))
         session_data["session_id"] = session_id
         session_data["created_at"] = datetime.now().isoformat()
         session_data["last_updated"] = datetime.now().isoformat()
@@ -37,37 +523,54 @@ class SessionMemoryManager:
         return session_data
 
     def get_session(self, session_id: str) -> Dict[str, Any]:
-        session_file = self.get_session_file_path(session_id)
-        if not session_file.exists():
-            return self.create_session(session_id)
-        try:
-            with open(session_file, 'r', encoding='utf-8') as f:
-                session_data = json.load(f)
-            session_data["last_updated"] = datetime.now().isoformat()
-            self.save_session(session_id, session_data)
+        # Reads never write; only a missing session is created
+        with self.session_lock(session_id):
+            session_data = self.store.load(session_id)
+            if session_data is None:
+                return self.create_session(session_id)
             return session_data
-        except Exception:
-            return self.create_session(session_id)
 
     def save_session(self, session_id: str, session_data: Dict[str, Any]) -> None:
-        session_file = self.get_session_file_path(session_id)
+        """Save session fields; conversation_history changes only through
+        append_message, replace_history and clear_messages."""
         session_data["last_updated"] = datetime.now().isoformat()
-        with open(session_file, 'w', encoding='utf-8') as f:
-            json.dump(session_data, f, indent=2, ensure_ascii=False)
+        self.store.save(session_id, session_data)
 
     def update_session(self, session_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
-        session_data = self.get_session(session_id)
-        session_data.update(updates)
-        self.save_session(session_id, session_data)
-        return session_data
+        updates = dict(updates)
+        history = updates.pop("conversation_history", None)
+        with self.session_lock(session_id):
+            session_data = self.get_session(session_id)
+            session_data.update(updates)
+            self.save_session(session_id, session_data)
+            if history is not None:
+                # An explicit new history replaces the stored one
+                self.replace_history(session_id, history)
+                session_data["conversation_history"] = list(history)
+            return session_data
+
+    def append_message(self, session_id: str, message: Dict[str, Any]) -> None:
+        """Append a message without rewriting the session."""
+        with self.session_lock(session_id):
+            if not self.store.exists(session_id):
+                self.create_session(session_id)
+            self.store.append_message(session_id, message, datetime.now().isoformat())
+
+    def replace_history(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Replace the whole conversation_history, e.g. to truncate it."""
+        with self.session_lock(session_id):
+            if not self.store.exists(session_id):
+                self.create_session(session_id)
+            self.store.replace_history(session_id, messages, datetime.now().isoformat())
+
+    def clear_messages(self, session_id: str) -> None:
+        self.replace_history(session_id, [])
+
+    def list_messages(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self.store.messages(session_id)
 
     def delete_session(self, session_id: str) -> bool:
-        session_file = self.get_session_file_path(session_id)
-        if session_file.exists():
-            os.remove(session_file)
-            return True
-        return False
+        return self.store.delete(session_id)
 
     def list_sessions(self) -> list:
-        session_files = list(self.storage_dir.glob("session_*.json"))
-        return [f.stem.replace("session_", "") for f in session_files] 
\ No newline at end of file
+        return self.store.list_ids()
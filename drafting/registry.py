@@ -0,0 +1,207 @@
+"""
+Document type registry
+Discovers template packs under drafting/templates/<pack>/ (pack.yaml or
+pack.json, a questions file and a template body). Only pack metadata is read
+at startup; questions and template bodies are loaded (templates compiled) on
+first use and kept in LRU caches, so import time and memory stay flat as the
+library grows.
+"""
+
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import yaml
+from pydantic import BaseModel, Field
+
+from .template_engine import CompiledTemplate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+PACK_FILES = ("pack.yaml", "pack.yml", "pack.json")
+# libyaml parser when available; several times faster for the startup index
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class TemplatePack(BaseModel):
+    """Metadata of one template pack, as indexed at startup"""
+
+    pack_id: str
+    path: str
+    document_type: str
+    name: str = ""
+    aliases: List[str] = Field(default_factory=list)
+    # Empty for the generic pack of a document type
+    jurisdiction: str = ""
+    questions: str = "questions.yaml"
+    template: str = "template.txt"
+
+
+def _read_structured(path: str) -> Any:
+    """Parse a YAML or JSON file"""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        return yaml.load(f, Loader=_YAML_LOADER)
+
+
+class _LRU:
+    """Thread-safe LRU of loaded pack contents"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        # Load outside the lock; a concurrent duplicate load is harmless
+        value = loader()
+        with self._lock:
+            self.loads += 1
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+
+class TemplateRegistry:
+    """Index of template packs with lazily loaded questions and template bodies"""
+
+    def __init__(self, root: str = DEFAULT_TEMPLATES_DIR, max_loaded: int = 128):
+        self.root = root
+        self.packs: Dict[str, TemplatePack] = {}
+        # (document_type, jurisdiction) -> pack_id
+        self._by_type: Dict[Tuple[str, str], str] = {}
+        # alias -> canonical document type
+        self._aliases: Dict[str, str] = {}
+        self._questions = _LRU(max_loaded)
+        self._templates = _LRU(max_loaded)
+        self._index()
+
+    def _index(self) -> None:
+        """Read the metadata file of every pack directory"""
+        if not os.path.isdir(self.root):
+            logger.warning(f"Template directory {self.root} not found; no document types available")
+            return
+        for entry in sorted(os.scandir(self.root), key=lambda e: e.name):
+            if not entry.is_dir():
+                continue
+            meta_path = next(
+                (
+                    os.path.join(entry.path, name)
+                    for name in PACK_FILES
+                    if os.path.isfile(os.path.join(entry.path, name))
+                ),
+                None,
+            )
+            if meta_path is None:
+                continue
+            try:
+                # Keys left empty in YAML fall back to their defaults
+                meta = {k: v for k, v in (_read_structured(meta_path) or {}).items() if v is not None}
+                pack = TemplatePack(pack_id=entry.name, path=entry.path, **meta)
+            except Exception as e:
+                logger.error(f"Skipping template pack {entry.name}: {e}")
+                continue
+            document_type = pack.document_type.lower().strip()
+            key = (document_type, pack.jurisdiction.lower().strip())
+            if key in self._by_type:
+                logger.warning(
+                    f"Template pack {entry.name} duplicates {self._by_type[key]} for {key}; skipped"
+                )
+                continue
+            self.packs[pack.pack_id] = pack
+            self._by_type[key] = pack.pack_id
+            for alias in [document_type, *pack.aliases]:
+                self._aliases.setdefault(alias.lower().strip(), document_type)
+        logger.info(f"Indexed {len(self.packs)} template packs from {self.root}")
+
+    def document_types(self) -> List[str]:
+        """Canonical document types, in index order"""
+        return list(dict.fromkeys(document_type for document_type, _ in self._by_type))
+
+    def aliases(self) -> Dict[str, str]:
+        """Alias -> canonical document type; canonical names map to themselves"""
+        return dict(self._aliases)
+
+    def resolve(self, document_type: str, jurisdiction: Optional[str] = None) -> Optional[TemplatePack]:
+        """Pack for a document type (or alias), preferring a jurisdiction-specific one"""
+        canonical = self._aliases.get(document_type.lower().strip())
+        if canonical is None:
+            return None
+        pack_id = None
+        if jurisdiction:
+            pack_id = self._by_type.get((canonical, jurisdiction.lower().strip()))
+        if pack_id is None:
+            pack_id = self._by_type.get((canonical, ""))
+        return self.packs.get(pack_id) if pack_id else None
+
+    def questions(self, document_type: str, jurisdiction: Optional[str] = None) -> Dict[str, Any]:
+        """Question config of a document type; loaded on first use"""
+        pack = self.resolve(document_type, jurisdiction)
+        if pack is None:
+            return {}
+        return self._questions.get_or_load(
+            pack.pack_id,
+            lambda: _read_structured(os.path.join(pack.path, pack.questions)) or {},
+        )
+
+    def template(
+        self, document_type: str, jurisdiction: Optional[str] = None
+    ) -> Optional[CompiledTemplate]:
+        """Compiled template of a document type; loaded and compiled on first use"""
+        pack = self.resolve(document_type, jurisdiction)
+        if pack is None:
+            return None
+        return self._templates.get_or_load(pack.pack_id, lambda: self._load_template(pack))
+
+    def _load_template(self, pack: TemplatePack) -> CompiledTemplate:
+        with open(os.path.join(pack.path, pack.template), encoding="utf-8") as f:
+            return CompiledTemplate(f.read())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "packs": len(self.packs),
+            "document_types": len(self.document_types()),
+            "questions": self._questions.stats(),
+            "templates": self._templates.stats(),
+        }
+
+
+_registry: Optional[TemplateRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> TemplateRegistry:
+    """Process-wide registry over DRAFTING_TEMPLATES_DIR (default: drafting/templates)"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TemplateRegistry(
+                os.getenv("DRAFTING_TEMPLATES_DIR", DEFAULT_TEMPLATES_DIR),
+                max_loaded=int(os.getenv("DRAFTING_TEMPLATE_CACHE_SIZE", "128")),
+            )
+        return _registry
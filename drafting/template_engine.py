@@ -0,0 +1,136 @@
+"""
+Compiled document templates
+A template is parsed once into literal and placeholder segments and rendered
+with a single join. The syntax extends the str.format fields used by the
+template packs:
+
+    {field}               value of field
+    {field|default}       default text when field is missing or empty
+    {?field}...{/field}   section rendered only when field is set
+    {^field}...{/field}   section rendered only when field is missing or empty
+    {{ and }}             literal braces
+"""
+
+import re
+from typing import Any, Iterable, List, Mapping, Tuple
+
+_TOKEN = re.compile(r"\{\{|\}\}|\{([?^/]?)([A-Za-z_][A-Za-z0-9_]*)(?:\|([^{}]*))?\}")
+
+# Segment kinds; literal segments are plain strings
+_FIELD = 0
+_SECTION = 1
+_INVERTED = 2
+
+
+class TemplateSyntaxError(ValueError):
+    """Unbalanced or mismatched section tags"""
+
+
+def _placeholder(name: str) -> str:
+    """Visible marker for a required field without a value"""
+    return "[" + name.replace("_", " ").title() + "]"
+
+
+def _parse(source: str) -> Tuple[list, Tuple[str, ...]]:
+    """Segments of a template and the names of all fields it references"""
+    root: list = []
+    # (section name, segments of the enclosing level)
+    stack: List[Tuple[str, list]] = []
+    segments = root
+    fields = {}
+    pos = 0
+
+    def literal(text):
+        if not text:
+            return
+        # Adjacent literals are merged so rendering appends as few parts as possible
+        if segments and segments[-1].__class__ is str:
+            segments[-1] += text
+        else:
+            segments.append(text)
+
+    for match in _TOKEN.finditer(source):
+        literal(source[pos:match.start()])
+        pos = match.end()
+        token = match.group(0)
+        if token == "{{" or token == "}}":
+            literal(token[0])
+            continue
+        sigil, name, default = match.groups()
+        fields.setdefault(name, None)
+        if sigil == "/":
+            if not stack or stack[-1][0] != name:
+                open_name = stack[-1][0] if stack else None
+                raise TemplateSyntaxError(
+                    f"Closing tag {{/{name}}} does not match open section {open_name!r}"
+                )
+            _, segments = stack.pop()
+        elif sigil:
+            children: list = []
+            segments.append((_SECTION if sigil == "?" else _INVERTED, name, children, False))
+            stack.append((name, segments))
+            segments = children
+        else:
+            # (kind, name, default or rendered marker, required)
+            if default is None:
+                segments.append((_FIELD, name, _placeholder(name), True))
+            else:
+                segments.append((_FIELD, name, default, False))
+    literal(source[pos:])
+    if stack:
+        raise TemplateSyntaxError(f"Section {stack[-1][0]!r} is never closed")
+    return root, tuple(fields)
+
+
+def _render(segments: list, values: Mapping[str, Any], out: List[str], strict: bool) -> None:
+    append = out.append
+    for segment in segments:
+        if segment.__class__ is str:
+            append(segment)
+            continue
+        # Fields carry their default, sections their child segments
+        kind, name, arg, required = segment
+        if kind == _FIELD:
+            value = values.get(name)
+            if value is None or (value == "" and not required):
+                if required and strict:
+                    raise KeyError(name)
+                append(arg)
+            else:
+                append(value if value.__class__ is str else str(value))
+        elif bool(values.get(name)) == (kind == _SECTION):
+            _render(arg, values, out, strict)
+
+
+class CompiledTemplate:
+    """A template parsed once; render() is a single pass over its segments"""
+
+    __slots__ = ("source", "fields", "_segments")
+
+    def __init__(self, source: str):
+        self.source = source
+        self._segments, self.fields = _parse(source)
+
+    def render(self, values: Mapping[str, Any], strict: bool = False) -> str:
+        """Fill the template from values
+
+        A required field without a value renders as a visible marker such as
+        "[Disclosing Party]", or raises KeyError when strict.
+        """
+        out: List[str] = []
+        _render(self._segments, values, out, strict)
+        return "".join(out)
+
+    def render_many(self, rows: Iterable[Mapping[str, Any]], strict: bool = False) -> List[str]:
+        """Render one document per row, for batch generation"""
+        segments = self._segments
+        documents = []
+        for values in rows:
+            out: List[str] = []
+            _render(segments, values, out, strict)
+            documents.append("".join(out))
+        return documents
+
+    def missing_fields(self, values: Mapping[str, Any]) -> List[str]:
+        """Referenced fields that have no value"""
+        return [name for name in self.fields if values.get(name) is None]
@@ -0,0 +1,168 @@
+"""
+Completion cache for deterministic LLM calls.
+Content-addressed by (provider models, prompt, generation params), with an
+in-memory LRU tier over a persistent SQLite tier. Call sites opt in per call
+with a CachePolicy.
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class CachePolicy(BaseModel):
+    """Per-call opt-in to the completion cache"""
+
+    ttl_seconds: float = 24 * 3600
+    # Keep the entry in memory only (not written to the disk tier)
+    memory_only: bool = False
+
+
+class CompletionCache:
+    """Two-tier (memory LRU over SQLite) cache of completion results"""
+
+    def __init__(self, db_path: str, memory_entries: int = 1024, max_disk_entries: int = 50_000):
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (content, provider, model, expires_at)
+        self._memory: "OrderedDict[str, Tuple[str, str, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, provider TEXT NOT NULL, "
+            "model TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_completions_last_used ON completions (last_used)"
+        )
+        # Drop entries that expired while the process was down
+        self._conn.execute("DELETE FROM completions WHERE expires_at < ?", (time.time(),))
+        self._conn.commit()
+        self._disk_size = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    @staticmethod
+    def key_for(
+        candidates: List[Tuple[str, str]],
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+    ) -> str:
+        """sha256 over the (provider, model) candidates, the prompt and the params"""
+        payload = json.dumps(
+            {
+                "models": candidates,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, entry: Tuple[str, str, str, float]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Tuple[str, str, str]]:
+        """(content, provider, model) of a live entry, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[3] >= now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[:3]
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT content, provider, model, expires_at FROM completions WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None or row[3] < now:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            # Promote to the memory tier
+            self._remember(key, tuple(row))
+            self.disk_hits += 1
+            return tuple(row[:3])
+
+    def put(self, key: str, content: str, provider: str, model: str, policy: CachePolicy) -> None:
+        """Store a completion under the policy's TTL"""
+        now = time.time()
+        entry = (content, provider, model, now + policy.ttl_seconds)
+        with self._lock:
+            self._remember(key, entry)
+            if policy.memory_only:
+                return
+            before = self._conn.total_changes
+            exists = self._conn.execute(
+                "SELECT 1 FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions "
+                "(key, content, provider, model, expires_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, *entry, now),
+            )
+            if not exists and self._conn.total_changes > before:
+                self._disk_size += 1
+            if self._disk_size > self.max_disk_entries:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """Drop expired entries, then least recently used ones down to 90% of the bound"""
+        expired = self._conn.execute("DELETE FROM completions WHERE expires_at < ?", (now,)).rowcount
+        self._disk_size -= expired
+        self.evictions += expired
+        excess = self._disk_size - int(self.max_disk_entries * 0.9)
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM completions WHERE key IN ("
+                "SELECT key FROM completions ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            self._disk_size -= excess
+            self.evictions += excess
+        logger.info(f"Completion cache evicted entries, {self._disk_size} left on disk")
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters per tier and current sizes"""
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": self._disk_size,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,75 @@
+"""
+LangChain chat model backed by the LLM gateway, for chains (such as the
+Document QA answer chain) that expect a BaseChatModel.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import ConfigDict, Field
+
+from .gateway import LLMGateway, get_gateway
+
+_ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+
+
+class GatewayChatModel(BaseChatModel):
+    """Chat model whose calls go through the shared gateway"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    gateway: LLMGateway = Field(default_factory=get_gateway)
+    providers: Optional[List[str]] = None
+    models: Optional[Dict[str, str]] = None
+    temperature: float = 0.3
+    max_tokens: int = 1024
+
+    @property
+    def _llm_type(self) -> str:
+        return "llm-gateway"
+
+    def _messages(self, messages: List[BaseMessage]) -> List[Dict[str, str]]:
+        return [
+            {"role": _ROLES.get(message.type, "user"), "content": message.content}
+            for message in messages
+        ]
+
+    def _kwargs(self) -> Dict[str, Any]:
+        return {
+            "providers": self.providers,
+            "models": self.models,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+
+    def _result(self, completion) -> ChatResult:
+        message = AIMessage(
+            content=completion.content,
+            response_metadata={"provider": completion.provider, "model": completion.model},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self._result(self.gateway.complete(self._messages(messages), **self._kwargs()))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        completion = await self.gateway.acomplete(self._messages(messages), **self._kwargs())
+        return self._result(completion)
@@ -0,0 +1,679 @@
+"""
+Central LLM Gateway
+Single control point for every LLM call made by the drafting, clarification and
+document QA agents: pooled HTTP connections to the OpenAI-compatible providers,
+per-provider concurrency limits and token-bucket rate limiting, retries with
+jittered backoff, circuit-breaker failover between providers, and an opt-in
+completion cache for deterministic calls.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import weakref
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+from pydantic import BaseModel, Field
+from dotenv import load_dotenv
+
+from .cache import CachePolicy, CompletionCache
+
+# Load environment variables from .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderConfig(BaseModel):
+    """Connection and limit settings of one OpenAI-compatible provider"""
+
+    name: str
+    base_url: str
+    api_key_env: str
+    model: str
+    max_concurrency: int = 8
+    requests_per_minute: float = 60.0
+    default_headers: Dict[str, str] = Field(default_factory=dict)
+
+
+# Failover order: earlier providers are preferred
+DEFAULT_PROVIDERS = [
+    ProviderConfig(
+        name="openrouter",
+        base_url="https://openrouter.ai/api/v1",
+        api_key_env="OPENROUTER_API_KEY",
+        model="deepseek/deepseek-chat-v3-0324:free",
+        requests_per_minute=20,
+        default_headers={
+            "HTTP-Referer": "http://localhost:8501",
+            "X-Title": "Agentic Legal AI",
+        },
+    ),
+    ProviderConfig(
+        name="groq",
+        base_url="https://api.groq.com/openai/v1",
+        api_key_env="GROQ_API_KEY",
+        model="llama3-70b-8192",
+        requests_per_minute=30,
+    ),
+    ProviderConfig(
+        name="gemini",
+        base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+        api_key_env="GEMINI_API_KEY",
+        model="gemini-2.5-flash",
+        requests_per_minute=15,
+    ),
+]
+
+# Transient failures worth retrying on the same provider
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+Prompt = Union[str, List[Dict[str, str]]]
+
+# Marks a reply refused by the caller's `accept` check (not a provider failure)
+_REJECTED = "response rejected by caller"
+
+
+class Completion(BaseModel):
+    """Text of a completion and the provider/model that produced it"""
+
+    content: str
+    provider: str
+    model: str
+    cached: bool = False
+
+
+class LLMGatewayError(Exception):
+    """Raised when every candidate provider failed"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket; callers reserve a token and wait until it is due"""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self) -> None:
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self) -> None:
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, event=None, loop=None, future=None):
+        self.event = event
+        self.loop = loop
+        self.future = future
+        # Set under the limit's lock when a released permit is handed to this waiter
+        self.granted = False
+
+
+class ConcurrencyLimit:
+    """One in-flight limit shared by threads and coroutines
+
+    A released permit is handed directly to the oldest waiter, whether it is
+    a blocked thread or a coroutine on any event loop, so sync and async
+    callers together never exceed the limit.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters: "deque[_Waiter]" = deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> bool:
+        # Caller holds the lock; queued waiters go first
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._try_acquire():
+                return
+            waiter = _Waiter(event=threading.Event())
+            self._waiters.append(waiter)
+        waiter.event.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                return
+            waiter = _Waiter(loop=loop, future=loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                    raise
+            # The permit arrived together with the cancellation; pass it on
+            self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                if waiter.event is not None:
+                    waiter.event.set()
+                    return
+                try:
+                    waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+                    return
+                except RuntimeError:
+                    # Its event loop is closed; the permit goes to the next waiter
+                    continue
+            self.in_flight -= 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self):
+        await self.aacquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one trial call through per reset window"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: re-arm so only this trial call goes through
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class _Provider:
+    """Runtime state of a provider: pooled clients, limits and breaker"""
+
+    def __init__(self, config: ProviderConfig, api_key: str, limits: httpx.Limits, timeout: httpx.Timeout):
+        self.config = config
+        self._api_key = api_key
+        self._limits = limits
+        self._timeout = timeout
+        # Retries are handled by the gateway, not the SDK
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=config.base_url,
+            default_headers=config.default_headers,
+            max_retries=0,
+            http_client=httpx.Client(limits=limits, timeout=timeout),
+        )
+        # One async client per event loop: its connections belong to the loop that opened them
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._async_lock = threading.Lock()
+        # Shared by sync and async calls: one in-flight limit per provider
+        self.concurrency = ConcurrencyLimit(config.max_concurrency)
+        self.bucket = TokenBucket(config.requests_per_minute / 60.0, capacity=config.max_concurrency)
+        self.breaker = CircuitBreaker()
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Pooled async client of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                # Clients of loops that have been closed can never be used again
+                for closed in [other for other in self._async_clients if other.is_closed()]:
+                    del self._async_clients[closed]
+                client = AsyncOpenAI(
+                    api_key=self._api_key,
+                    base_url=self.config.base_url,
+                    default_headers=self.config.default_headers,
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(limits=self._limits, timeout=self._timeout),
+                )
+                self._async_clients[loop] = client
+            return client
+
+
+def _load_provider_configs() -> List[ProviderConfig]:
+    """Default providers with LLM_<NAME>_MODEL/_RPM/_CONCURRENCY environment overrides"""
+    configs = []
+    for config in DEFAULT_PROVIDERS:
+        prefix = f"LLM_{config.name.upper()}_"
+        updates = {}
+        if os.getenv(prefix + "MODEL"):
+            updates["model"] = os.getenv(prefix + "MODEL")
+        if os.getenv(prefix + "RPM"):
+            updates["requests_per_minute"] = float(os.getenv(prefix + "RPM"))
+        if os.getenv(prefix + "CONCURRENCY"):
+            updates["max_concurrency"] = int(os.getenv(prefix + "CONCURRENCY"))
+        configs.append(config.model_copy(update=updates))
+    return configs
+
+
+class LLMGateway:
+    """Shared entry point for chat completions with limits, retries and failover"""
+
+    def __init__(
+        self,
+        providers: Optional[List[ProviderConfig]] = None,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        timeout: float = 120.0,
+        cache_path: Optional[str] = None,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        http_timeout = httpx.Timeout(timeout, connect=10.0)
+        # Completion cache is opened on first use by a caching call site
+        self.cache_path = cache_path or os.getenv("LLM_CACHE_PATH", "./llm_cache.sqlite3")
+        self._completion_cache: Optional[CompletionCache] = None
+        self._cache_lock = threading.Lock()
+
+        # Only providers with an API key configured take part
+        self.providers: Dict[str, _Provider] = {}
+        for config in providers or _load_provider_configs():
+            api_key = os.getenv(config.api_key_env)
+            if api_key:
+                self.providers[config.name] = _Provider(config, api_key, limits, http_timeout)
+                logger.info(f"LLM gateway provider '{config.name}' ready ({config.model})")
+        if not self.providers:
+            logger.warning("LLM gateway has no providers; set OPENROUTER_API_KEY, GROQ_API_KEY or GEMINI_API_KEY")
+
+    def available_providers(self, names: Optional[List[str]] = None) -> List[str]:
+        """Configured providers, in failover order, optionally restricted to `names`"""
+        if names is None:
+            return list(self.providers)
+        return [name for name in names if name in self.providers]
+
+    def model_for(self, provider: str, models: Optional[Dict[str, str]] = None) -> str:
+        """Model used on a provider, honouring per-call overrides"""
+        if models and provider in models:
+            return models[provider]
+        return self.providers[provider].config.model
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {
+            name: {
+                "model": provider.config.model,
+                "circuit": provider.breaker.state,
+                "consecutive_failures": provider.breaker.failures,
+                "in_flight": provider.concurrency.in_flight,
+            }
+            for name, provider in self.providers.items()
+        }
+
+    @property
+    def completion_cache(self) -> CompletionCache:
+        with self._cache_lock:
+            if self._completion_cache is None:
+                self._completion_cache = CompletionCache(self.cache_path)
+            return self._completion_cache
+
+    def _cached(self, candidates, messages, models, temperature, max_tokens, accept):
+        """Cache key of a call and the cached completion, if any"""
+        key = CompletionCache.key_for(
+            [(provider.name, self.model_for(provider.name, models)) for provider in candidates],
+            messages,
+            temperature,
+            max_tokens,
+        )
+        hit = self.completion_cache.get(key)
+        if hit is None or (accept is not None and not accept(hit[0])):
+            return key, None
+        content, provider, model = hit
+        return key, Completion(content=content, provider=provider, model=model, cached=True)
+
+    def _candidates(self, providers: Optional[List[str]]) -> List[_Provider]:
+        candidates = [self.providers[name] for name in self.available_providers(providers)]
+        if not candidates:
+            raise LLMGatewayError(f"No LLM provider configured among {providers or 'any'}")
+        return candidates
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def _messages(prompt: Prompt) -> List[Dict[str, str]]:
+        if isinstance(prompt, str):
+            return [{"role": "user", "content": prompt}]
+        return prompt
+
+    def _request(self, provider: _Provider, messages, models, temperature, max_tokens) -> Dict:
+        return {
+            "model": self.model_for(provider.name, models),
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+
+    def complete(
+        self,
+        prompt: Prompt,
+        *,
+        providers: Optional[List[str]] = None,
+        models: Optional[Dict[str, str]] = None,
+        temperature: float = 0.3,
+        max_tokens: int = 1024,
+        accept: Optional[Callable[[str], bool]] = None,
+        cache: Optional[CachePolicy] = None,
+    ) -> Completion:
+        """Blocking completion with retries and failover
+
+        `accept` can reject an unusable reply (e.g. too short); the next
+        provider is then tried without counting it against the breaker.
+        `cache` opts a deterministic call into the completion cache.
+        """
+        messages = self._messages(prompt)
+        candidates = self._candidates(providers)
+        if cache is not None:
+            cache_key, hit = self._cached(candidates, messages, models, temperature, max_tokens, accept)
+            if hit is not None:
+                return hit
+        errors = []
+        for provider in candidates:
+            if not provider.breaker.allow():
+                errors.append(f"{provider.name}: circuit open")
+                continue
+            request = self._request(provider, messages, models, temperature, max_tokens)
+            error = None
+            for attempt in range(self.max_retries + 1):
+                provider.bucket.acquire()
+                try:
+                    with provider.concurrency:
+                        response = provider.client.chat.completions.create(**request)
+                except RETRYABLE_ERRORS as e:
+                    error = e
+                    if attempt < self.max_retries:
+                        time.sleep(self._backoff(attempt))
+                        continue
+                    break
+                except Exception as e:
+                    error = e
+                    break
+                provider.breaker.record_success()
+                content = (response.choices[0].message.content or "").strip()
+                if accept is not None and not accept(content):
+                    error = _REJECTED
+                    break
+                completion = Completion(content=content, provider=provider.name, model=request["model"])
+                if cache is not None:
+                    self.completion_cache.put(cache_key, content, provider.name, request["model"], cache)
+                return completion
+            if error is not _REJECTED:
+                provider.breaker.record_failure()
+            errors.append(f"{provider.name}: {error}")
+            logger.warning(f"LLM provider '{provider.name}' failed, failing over: {error}")
+        raise LLMGatewayError("All LLM providers failed: " + "; ".join(errors))
+
+    async def acomplete(
+        self,
+        prompt: Prompt,
+        *,
+        providers: Optional[List[str]] = None,
+        models: Optional[Dict[str, str]] = None,
+        temperature: float = 0.3,
+        max_tokens: int = 1024,
+        accept: Optional[Callable[[str], bool]] = None,
+        cache: Optional[CachePolicy] = None,
+    ) -> Completion:
+        """Async counterpart of complete; never blocks the event loop"""
+        messages = self._messages(prompt)
+        candidates = self._candidates(providers)
+        if cache is not None:
+            cache_key, hit = self._cached(candidates, messages, models, temperature, max_tokens, accept)
+            if hit is not None:
+                return hit
+        errors = []
+        for provider in candidates:
+            if not provider.breaker.allow():
+                errors.append(f"{provider.name}: circuit open")
+                continue
+            request = self._request(provider, messages, models, temperature, max_tokens)
+            error = None
+            for attempt in range(self.max_retries + 1):
+                await provider.bucket.aacquire()
+                try:
+                    async with provider.concurrency:
+                        response = await provider.async_client.chat.completions.create(**request)
+                except RETRYABLE_ERRORS as e:
+                    error = e
+                    if attempt < self.max_retries:
+                        await asyncio.sleep(self._backoff(attempt))
+                        continue
+                    break
+                except Exception as e:
+                    error = e
+                    break
+                provider.breaker.record_success()
+                content = (response.choices[0].message.content or "").strip()
+                if accept is not None and not accept(content):
+                    error = _REJECTED
+                    break
+                completion = Completion(content=content, provider=provider.name, model=request["model"])
+                if cache is not None:
+                    self.completion_cache.put(cache_key, content, provider.name, request["model"], cache)
+                return completion
+            if error is not _REJECTED:
+                provider.breaker.record_failure()
+            errors.append(f"{provider.name}: {error}")
+            logger.warning(f"LLM provider '{provider.name}' failed, failing over: {error}")
+        raise LLMGatewayError("All LLM providers failed: " + "; ".join(errors))
+
+    def stream(
+        self,
+        prompt: Prompt,
+        *,
+        providers: Optional[List[str]] = None,
+        models: Optional[Dict[str, str]] = None,
+        temperature: float = 0.3,
+        max_tokens: int = 1024,
+    ) -> Iterator[str]:
+        """Yield tokens as they arrive; failover only happens before the first token
+
+        The provider's concurrency permit and HTTP connection are held until the
+        stream is exhausted or closed. A caller that may stop early must close the
+        generator (e.g. `with contextlib.closing(gateway.stream(...))`) rather than
+        leave it to garbage collection.
+        """
+        messages = self._messages(prompt)
+        errors = []
+        for provider in self._candidates(providers):
+            if not provider.breaker.allow():
+                errors.append(f"{provider.name}: circuit open")
+                continue
+            request = self._request(provider, messages, models, temperature, max_tokens)
+            error = None
+            for attempt in range(self.max_retries + 1):
+                provider.bucket.acquire()
+                started = False
+                provider.concurrency.acquire()
+                try:
+                    # Closing the generator (GeneratorExit at the yield) closes the
+                    # response here and releases the permit in the finally below
+                    with provider.client.chat.completions.create(**request, stream=True) as stream:
+                        for chunk in stream:
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                started = True
+                                yield chunk.choices[0].delta.content
+                    provider.breaker.record_success()
+                    return
+                except RETRYABLE_ERRORS as e:
+                    if started:
+                        provider.breaker.record_failure()
+                        raise
+                    error = e
+                    if attempt < self.max_retries:
+                        time.sleep(self._backoff(attempt))
+                        continue
+                    break
+                except Exception as e:
+                    if started:
+                        raise
+                    error = e
+                    break
+                finally:
+                    provider.concurrency.release()
+            provider.breaker.record_failure()
+            errors.append(f"{provider.name}: {error}")
+            logger.warning(f"LLM provider '{provider.name}' failed, failing over: {error}")
+        raise LLMGatewayError("All LLM providers failed: " + "; ".join(errors))
+
+    async def astream(
+        self,
+        prompt: Prompt,
+        *,
+        providers: Optional[List[str]] = None,
+        models: Optional[Dict[str, str]] = None,
+        temperature: float = 0.3,
+        max_tokens: int = 1024,
+    ) -> AsyncIterator[str]:
+        """Async counterpart of stream; callers that may stop early must aclose() it"""
+        messages = self._messages(prompt)
+        errors = []
+        for provider in self._candidates(providers):
+            if not provider.breaker.allow():
+                errors.append(f"{provider.name}: circuit open")
+                continue
+            request = self._request(provider, messages, models, temperature, max_tokens)
+            error = None
+            for attempt in range(self.max_retries + 1):
+                await provider.bucket.aacquire()
+                started = False
+                await provider.concurrency.aacquire()
+                try:
+                    stream = await provider.async_client.chat.completions.create(**request, stream=True)
+                    async with stream:
+                        async for chunk in stream:
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                started = True
+                                yield chunk.choices[0].delta.content
+                    provider.breaker.record_success()
+                    return
+                except RETRYABLE_ERRORS as e:
+                    if started:
+                        provider.breaker.record_failure()
+                        raise
+                    error = e
+                    if attempt < self.max_retries:
+                        await asyncio.sleep(self._backoff(attempt))
+                        continue
+                    break
+                except Exception as e:
+                    if started:
+                        raise
+                    error = e
+                    break
+                finally:
+                    provider.concurrency.release()
+            provider.breaker.record_failure()
+            errors.append(f"{provider.name}: {error}")
+            logger.warning(f"LLM provider '{provider.name}' failed, failing over: {error}")
+        raise LLMGatewayError("All LLM providers failed: " + "; ".join(errors))
+
+    def close(self) -> None:
+        """Close pooled connections (sync clients; async ones are per loop and close with it)"""
+        for provider in self.providers.values():
+            provider.client.close()
+        if self._completion_cache is not None:
+            self._completion_cache.close()
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Process-wide gateway shared by every agent"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
@@ -0,0 +1,139 @@
+"""
+Search fan-out tests for clarification.graphSearch.LegalSearchGraph
+The web search backend and the LLM gateway are replaced by stubs, so the tests
+run offline and count every backend call.
+
+Usage: python -m pytest test_clarification.py
+"""
+
+import threading
+
+import pytest
+
+import clarification.graphSearch as graph_search
+from clarification.graphSearch import LegalSearchGraph
+
+KEYWORDS = ["void contract", "voidable contract", "Canada"]
+QUESTION = "What is the difference between void and voidable contracts?"
+
+
+class Completion:
+    def __init__(self, content, provider):
+        self.content = content
+        self.provider = provider
+        self.cached = False
+
+
+class StubGateway:
+    """Keyword extraction: each provider returns its own fixed keywords"""
+
+    def __init__(self, keywords_by_provider):
+        self.keywords_by_provider = keywords_by_provider
+
+    def available_providers(self, names=None):
+        return [name for name in names or self.keywords_by_provider if name in self.keywords_by_provider]
+
+    def complete(self, prompt, providers=None, **kwargs):
+        provider = (providers or list(self.keywords_by_provider))[0]
+        return Completion(", ".join(self.keywords_by_provider[provider]), provider)
+
+
+class StubBackend:
+    """Records queries; `results` maps a query to its entries (default: none)"""
+
+    def __init__(self, results=None, default=()):
+        self.results = results or {}
+        self.default = list(default)
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def __call__(self, query):
+        with self._lock:
+            self.queries.append(query)
+        return "\n\n".join(self.results.get(query, self.default))
+
+
+@pytest.fixture
+def make_graph(monkeypatch):
+    def make(backend, keywords_by_provider=None, **kwargs):
+        gateway = StubGateway(keywords_by_provider or {"groq": KEYWORDS})
+        monkeypatch.setattr(graph_search, "get_gateway", lambda: gateway)
+        return LegalSearchGraph(search_backend=backend, **kwargs)
+
+    return make
+
+
+def test_fan_out_runs_each_variant_once(make_graph):
+    backend = StubBackend(default=[f"Result {i}" for i in range(3)])
+    graph = make_graph(backend)
+
+    result = graph.search_legal_query(QUESTION)
+
+    sites = "site:canlii.org OR site:justice.gc.ca"
+    joined = " ".join(KEYWORDS)
+    expected = {
+        f"{joined} {sites}",
+        QUESTION,
+        f"{joined} site:canlii.org",
+        f"{joined} site:justice.gc.ca",
+        *(f"{keyword} {sites}" for keyword in KEYWORDS),
+    }
+    assert sorted(backend.queries) == sorted(expected)
+    assert result["success"] and result["keywords"] == KEYWORDS
+
+
+def test_merged_results_are_deduplicated(make_graph):
+    # Every variant returns the same entries, modulo whitespace and case
+    backend = StubBackend(default=["Void contracts have no effect.", "VOID  contracts have no effect.", "Voidable ones do."])
+    graph = make_graph(backend)
+
+    results = graph.search_legal_query(QUESTION)["results"]
+
+    assert [r["content"] for r in results] == ["Void contracts have no effect.", "Voidable ones do."]
+
+
+def test_searches_are_capped_and_never_repeated(make_graph):
+    backend = StubBackend()  # never finds anything, so every round retries
+    graph = make_graph(backend, keywords_by_provider={"groq": KEYWORDS, "gemini": ["nullity", "Canada"]},
+                       max_searches_per_query=10)
+
+    result = graph.search_legal_query(QUESTION)
+
+    assert result["results"] == []
+    assert len(backend.queries) == 10
+    assert len(set(backend.queries)) == len(backend.queries)
+
+
+def test_retry_sends_only_new_variants(make_graph):
+    sites = "site:canlii.org OR site:justice.gc.ca"
+    # The site-restricted round finds one entry; the unrestricted retry finds more
+    backend = StubBackend(results={
+        f"{' '.join(KEYWORDS)} {sites}": ["Void contracts have no effect."],
+        " ".join(KEYWORDS): ["Voidable contracts can be rescinded.", "Void contracts have no effect."],
+    })
+    graph = make_graph(backend)
+
+    result = graph.search_legal_query(QUESTION)
+
+    assert len(set(backend.queries)) == len(backend.queries)
+    assert " ".join(KEYWORDS) in backend.queries
+    assert [r["content"] for r in result["results"]] == [
+        "Void contracts have no effect.",
+        "Voidable contracts can be rescinded.",
+    ]
+
+
+def test_cache_hits_skip_the_backend(make_graph):
+    backend = StubBackend(default=["Result 1", "Result 2"])
+    graph = make_graph(backend)
+    graph.search_legal_query(QUESTION)
+    calls = len(backend.queries)
+
+    # Same question up to case, spacing and punctuation: served from the question cache
+    again = graph.search_legal_query("  what is the DIFFERENCE between void and voidable contracts ")
+    assert again["cached"] is True
+    # A different question with the same keywords: served from the keyword cache
+    other = graph.search_legal_query("How do void and voidable contracts differ in Canada?")
+    assert other["results"] and not other.get("cached")
+
+    assert len(backend.queries) == calls
@@ -0,0 +1,144 @@
+"""
+Re-indexing tests for document_qa.graphRag.VectorStoreManager
+Runs against a real Chroma store in a temp directory; the HuggingFace model is
+replaced by a small deterministic embedding so no model download is needed.
+
+Usage: python -m pytest test_document_qa.py
+"""
+
+import hashlib
+
+import pytest
+from langchain_core.documents import Document
+
+from document_qa.graphRag import DocumentProcessor, VectorStoreManager
+
+
+class HashEmbeddings:
+    """Deterministic bag-of-words embedding"""
+
+    model_name = "test-hash-embeddings"
+    dimensions = 32
+
+    def _embed(self, text):
+        vector = [0.0] * self.dimensions
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dimensions] += 1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(VectorStoreManager, "_initialize_embeddings", lambda self: HashEmbeddings())
+    return VectorStoreManager(persist_directory=str(tmp_path), embed_workers=1)
+
+
+def chunk_windows(doc_key, pages):
+    """One window per page, with stable chunk IDs"""
+    windows = []
+    for page, text in enumerate(pages):
+        chunk = Document(page_content=text, metadata={"page": page, "start_index": 0, "source": doc_key})
+        windows.append(DocumentProcessor.assign_chunk_ids([chunk], doc_key))
+    return windows
+
+
+def failing_after(windows, count):
+    """Yield `count` windows, then fail as an embedding or loader error would"""
+    for window in windows[:count]:
+        yield window
+    raise RuntimeError("injected failure")
+
+
+OLD_PAGES = [
+    "The tenant shall pay rent on the first day of each month.",
+    "The security deposit is returned within thirty days of move out.",
+    "Either party may terminate the lease with sixty days written notice.",
+    "The landlord is responsible for structural repairs to the premises.",
+]
+
+
+def test_failed_reindex_keeps_previous_version(manager):
+    session, doc_key = "s1", "lease.pdf"
+    manager.upsert_document_stream(chunk_windows(doc_key, OLD_PAGES), doc_key, session_id=session, doc_hash="old")
+    # Open the retriever so the lexical index is live and kept in sync during the upsert
+    manager.get_retriever(session, doc_hash="old")
+
+    # Pages 0, 1 and 3 are unchanged (kept), page 2 changes, a page is added
+    new_pages = OLD_PAGES[:2] + ["Either party may terminate with ninety days notice."] + OLD_PAGES[3:] + [
+        "Pets are not permitted without written consent."
+    ]
+    with pytest.raises(RuntimeError):
+        manager.upsert_document_stream(
+            failing_after(chunk_windows(doc_key, new_pages), 4), doc_key, session_id=session, doc_hash="new"
+        )
+
+    assert not manager.is_indexed("new", session_id=session)
+    assert manager.is_indexed("old", session_id=session)
+
+    collection = manager._get_collection(session)
+    stored = collection.get(where={"doc_key": doc_key}, include=["metadatas"])
+    assert len(stored["ids"]) == len(OLD_PAGES)
+    assert {metadata["doc_hash"] for metadata in stored["metadatas"]} == {"old"}
+
+    retriever = manager.get_retriever(session, doc_hash="old")
+    for query, expected in [
+        ("When is the security deposit returned?", OLD_PAGES[1]),
+        ("terminate the lease with sixty days written notice", OLD_PAGES[2]),
+    ]:
+        results = retriever.retrieve(query)
+        assert results and results[0].page_content == expected
+        assert all(document.metadata["doc_hash"] == "old" for document in results)
+
+
+def test_reindex_moves_unchanged_chunks_to_new_version(manager):
+    session, doc_key = "s2", "lease.pdf"
+    manager.upsert_document_stream(chunk_windows(doc_key, OLD_PAGES), doc_key, session_id=session, doc_hash="old")
+    new_pages = OLD_PAGES[:3] + ["The tenant is responsible for minor repairs."]
+
+    stats = manager.upsert_document_stream(
+        chunk_windows(doc_key, new_pages), doc_key, session_id=session, doc_hash="new"
+    )
+
+    assert stats == {"added": 1, "unchanged": 3, "deleted": 1}
+    assert manager.is_indexed("new", session_id=session)
+    assert not manager.is_indexed("old", session_id=session)
+
+
+class Crash(BaseException):
+    """A process dying mid-stream: escapes the `except Exception` rollback"""
+
+
+def test_partial_reindex_never_looks_indexed(manager):
+    session, doc_key = "s3", "lease.pdf"
+    manager.upsert_document_stream(chunk_windows(doc_key, OLD_PAGES), doc_key, session_id=session, doc_hash="old")
+    new_pages = OLD_PAGES[:2] + ["Either party may terminate with ninety days notice.", "Pets are not permitted."]
+    seen_mid_stream = []
+
+    def windows_then_crash():
+        for window in chunk_windows(doc_key, new_pages):
+            yield window
+            seen_mid_stream.append(manager.is_indexed("new", session_id=session))
+        raise Crash()
+
+    with pytest.raises(Crash):
+        manager.upsert_document_stream(windows_then_crash(), doc_key, session_id=session, doc_hash="new")
+
+    assert seen_mid_stream and not any(seen_mid_stream)
+    assert not manager.is_indexed("new", session_id=session)
+
+    # The next indexing run picks up the leftovers and completes the new version
+    stats = manager.upsert_document_stream(
+        chunk_windows(doc_key, new_pages), doc_key, session_id=session, doc_hash="new"
+    )
+    assert stats["deleted"] == 2
+    assert manager.is_indexed("new", session_id=session)
+    stored = manager._get_collection(session).get(where={"doc_key": doc_key}, include=["metadatas"])
+    assert len(stored["ids"]) == len(new_pages)
+    assert {metadata["doc_hash"] for metadata in stored["metadatas"]} == {"new"}
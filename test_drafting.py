@@ -0,0 +1,30 @@
+"""
+Document type matching tests for drafting.prompt_templates
+Aliases come from the template packs in drafting/templates/.
+
+Usage: python -m pytest test_drafting.py
+"""
+
+import pytest
+
+from drafting.prompt_templates import match_document_type
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("I need an NDA", "nda"),
+        ("Draft a non-disclosure agreement for my startup", "nda"),
+        ("contractor agreement", "contract"),
+        ("I need an independent contractor agreement", "contract"),
+        ("Can you write a service agreement?", "contract"),
+        ("employment contracts for two hires", "contract"),
+        ("a rental agreement for my flat", "lease"),
+        ("Residential Lease Agreement please", "lease"),
+        ("I want to rent out my property: a rental", "lease"),
+        ("an agreement", None),
+        ("hello there", None),
+    ],
+)
+def test_match_document_type(text, expected):
+    assert match_document_type(text) == expected